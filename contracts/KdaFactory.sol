@@ -0,0 +1,73 @@
+//SPDX-License-Identifier: UNLICENSED
+
+
+pragma solidity ^0.8.16;
+
+/**
+ * @dev Deploys the KDA contracts with CREATE2, so that the deployer knows their addresses before sending anything.
+ * KdaCommon makes msg.sender the owner of a contract, hence the contracts deployed by the factory are owned by the
+ * factory: the owner of the factory wires them through execute or executeBatch and then hands their ownership back
+ * with setOwner.
+ */
+contract KdaFactory {
+
+    address public owner;
+
+    event Deployed(bytes32 salt, address deployed);
+
+    constructor(){
+        owner = msg.sender;
+    }
+
+    modifier onlyOwner() {
+        require(msg.sender == owner, "Only the owner can perform this action.");
+        _;
+    }
+
+    /**
+     * @dev deploys initCode (bytecode followed by the abi encoded constructor arguments) at the address given by
+     * computeAddress(salt, keccak256(initCode))
+     */
+    function deploy(bytes32 salt, bytes memory initCode) public onlyOwner returns (address deployed) {
+        assembly {
+            deployed := create2(0, add(initCode, 0x20), mload(initCode), salt)
+        }
+        require(deployed != address(0), "CREATE2 deployment failed");
+        emit Deployed(salt, deployed);
+    }
+
+    /**
+     * @dev returns the address at which deploy(salt, initCode) deploys a contract
+     */
+    function computeAddress(bytes32 salt, bytes32 initCodeHash) public view returns (address) {
+        return address(uint160(uint256(keccak256(abi.encodePacked(bytes1(0xff), address(this), salt, initCodeHash)))));
+    }
+
+    /**
+     * @dev calls target with data as the factory, reverting with the error of the call if it fails. A call to an
+     * address without code would succeed without doing anything, for example if the deployment of target reverted,
+     * hence it reverts as well.
+     */
+    function execute(address target, bytes memory data) public onlyOwner returns (bytes memory) {
+        require(target.code.length > 0, "target has no code");
+        (bool success, bytes memory result) = target.call(data);
+        if (!success) {
+            assembly {
+                revert(add(result, 0x20), mload(result))
+            }
+        }
+        return result;
+    }
+
+    /**
+     * @dev calls every target with the matching data as the factory, in order, in a single transaction.
+     * If any call fails, or a target has no code, the whole batch reverts with the error of that call, so the
+     * contracts called by the batch are either completely wired or not touched at all.
+     */
+    function executeBatch(address[] memory targets, bytes[] memory data) public onlyOwner {
+        require(targets.length == data.length, "targets and data have different lengths");
+        for (uint256 i = 0; i < targets.length; i++) {
+            execute(targets[i], data[i]);
+        }
+    }
+}
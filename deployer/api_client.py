@@ -0,0 +1,231 @@
+"""
+HTTP client of the backend API used by tests.py and load_test.py.
+
+Requests go through a pool of keep-alive connections shared by every thread: a connection is taken from the pool for
+one request and response and then given back, so the TCP handshake is only paid when the pool grows. A connection
+closed by the server while idle is replaced and its request sent again once. Every endpoint the tests call has its
+own method taking and returning decoded JSON.
+
+Usage:
+    api = ApiClient("localhost", 8000, jwt)
+    data = api.create_notice(notice)["data"]
+    status, body = api.sign_transaction(sign)
+    status, body = api.transaction_status(trx_id)
+"""
+
+import http.client
+import json
+import queue
+import threading
+from contextlib import contextmanager
+from time import perf_counter_ns
+
+# errors of a keep-alive connection closed by the server while it was idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class ApiError(Exception):
+
+    def __init__(self, method, path, status, body):
+        """
+        :param status: http status of the response, None if no response was received
+        """
+        super().__init__("%s %s failed with status %s: %s" % (method, path, status, str(body)[:200]))
+        self.status = status
+        self.body = body
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of at most size keep-alive connections to one host.
+    """
+
+    def __init__(self, host, port, size=10, timeout=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields (connection, reused): a connection for one request and whether it was used before. The connection
+        goes back to the pool unless the block raised.
+        """
+        with self._slots:
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+            try:
+                yield conn, reused
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def encode_json(payload):
+    return b'' if payload is None else json.dumps(payload).encode()
+
+
+def decode_json(data):
+    """
+    Decodes a response body, which is returned as text if it is not json.
+    """
+    if not data:
+        return {}
+    try:
+        return json.loads(data)
+    except ValueError:
+        return data.decode("utf-8", "replace")
+
+
+class ApiClient:
+
+    def __init__(self, host, port, jwt, pool_size=10, timeout=30, observer=None):
+        """
+        :param pool_size: largest number of connections open at once
+        :param observer: function called with (method, path, status, nanoseconds) after every request, status is
+                         None when no response was received
+        """
+        self.pool = ConnectionPool(host, port, pool_size, timeout)
+        self.headers = {
+            'Authorization': 'bearer ' + jwt,
+            'Content-Type': 'application/json'
+        }
+        self.observer = observer
+
+    def send(self, method, path, payload=None):
+        """
+        Sends a request and reads its response.
+        :return: tuple (http status, decoded body)
+        :raise ApiError: if no response could be received
+        """
+        body = encode_json(payload)
+        for attempt in range(2):
+            start = perf_counter_ns()
+            reused = False
+            try:
+                with self.pool.connection() as (conn, reused):
+                    conn.request(method, path, body, self.headers)
+                    res = conn.getresponse()
+                    data = res.read()
+            except STALE_CONNECTION_ERRORS as e:
+                if reused and attempt == 0:
+                    continue
+                self._observe(method, path, None, start)
+                raise ApiError(method, path, None, e)
+            except (http.client.HTTPException, OSError) as e:
+                self._observe(method, path, None, start)
+                raise ApiError(method, path, None, e)
+            self._observe(method, path, res.status, start)
+            return res.status, decode_json(data)
+
+    def call(self, method, path, payload=None):
+        """
+        Sends a request which must succeed.
+        :return: the decoded body
+        :raise ApiError: if the response is not a 200
+        """
+        status, body = self.send(method, path, payload)
+        if status != 200:
+            raise ApiError(method, path, status, body)
+        return body
+
+    def _observe(self, method, path, status, start):
+        if self.observer is not None:
+            self.observer(method, path, status, perf_counter_ns() - start)
+
+    def close(self):
+        self.pool.close()
+
+    # users
+
+    def add_user(self):
+        return self.call("POST", "/tdr/addUser")
+
+    def add_officer(self, officer):
+        return self.call("POST", "/user/kda/addOfficer", officer)
+
+    def update_officer(self, officer):
+        return self.call("POST", "/user/kda/updateOfficer", officer)
+
+    def dashboard_data(self):
+        return self.call("GET", "/user/getDashboardData")
+
+    def sign_transaction(self, sign):
+        """
+        Signs a transaction created by another endpoint. Does not raise on an error status, so that the caller can
+        retry while the transaction is not ready.
+        :param sign: the trxId with the otp and password of the user
+        :return: tuple (http status, decoded body)
+        """
+        return self.send("POST", "/user/transaction/sign", sign)
+
+    def transaction_status(self, trx_id):
+        """
+        Reads the status of a signed transaction, "pending" until the backend sees it mined. Does not raise on an
+        error status, so that the caller can poll it. The route is served by simulator.py, a backend without it
+        answers 404.
+        :param trx_id: trxId of the transaction
+        :return: tuple (http status, decoded body)
+        """
+        return self.send("POST", "/user/transaction/status", {"trxId": trx_id})
+
+    # TDR applications
+
+    def create_notice(self, notice):
+        return self.call("POST", "/tdr/notice/create", notice)
+
+    def create_tdr_application(self, application):
+        return self.call("POST", "/tdr/application/create", application)
+
+    def sign_tdr_application(self, application_id):
+        return self.call("POST", "/tdr/application/sign", {"applicationId": application_id})
+
+    def tdr_user_sign_status(self, application_id):
+        return self.call("POST", "/tdr/application/UserSignStatus", {"applicationId": application_id})
+
+    def verify_tdr_application(self, application_id):
+        return self.call("POST", "/tdr/application/verify", {"applicationId": application_id})
+
+    def approve_tdr_application(self, application_id):
+        return self.call("POST", "/tdr/application/approve", {"applicationId": application_id})
+
+    def issue_drc(self, application_id, far_granted):
+        return self.call("POST", "/tdr/application/issueDrc",
+                         {"applicationId": application_id, "farGranted": far_granted})
+
+    # DRC transfer applications
+
+    def create_dta(self, dta):
+        return self.call("POST", "/drc/application/transfer/create", dta)
+
+    def sign_dta(self, application_id):
+        return self.call("POST", "/drc/application/transfer/sign", {"applicationId": application_id})
+
+    def verify_dta(self, application_id):
+        return self.call("POST", "/drc/application/transfer/verify", {"applicationId": application_id})
+
+    def approve_dta(self, application_id):
+        return self.call("POST", "/drc/application/transfer/approve", {"applicationId": application_id})
+
+    # DRC utilization applications
+
+    def create_dua(self, dua):
+        return self.call("POST", "/drc/application/utilization/create", dua)
+
+    def sign_dua(self, application_id):
+        return self.call("POST", "/drc/application/utilization/sign", {"applicationId": application_id})
+
+    def get_dua(self, application_id):
+        return self.call("POST", "/drc/application/utilization/get", {"applicationId": application_id})
@@ -0,0 +1,143 @@
+"""
+Native publishing of the build artifacts.
+
+The ABI and bytecode files, addresses.txt and the other build outputs are written with an atomic rename, so a
+reader never sees a half written file, and the directories are created once per run instead of forking a mkdir for
+every file. The abi, contract_address, packed and index directories are then mirrored into the backend and the
+quorum-event-parser trees by content hash: only the files which changed are copied, stale files are removed
+afterwards, and the consumer directories are never emptied in between.
+
+Next to the individual files, all the ABIs and bytecodes are packed in ../build/packed/contracts.kdab, see
+packed_artifacts.py, and the event topics and function selectors of the deployment are indexed in
+../build/index/topic_index.json, see topic_index.py.
+"""
+
+import hashlib
+import json
+import os
+
+from packed_artifacts import PACKED_FILE, pack
+from topic_index import INDEX_FILE, build_index
+
+BUILD_DIR = "../build"
+ABI_DIR = os.path.join(BUILD_DIR, "abi")
+BYTECODE_DIR = os.path.join(BUILD_DIR, "bytecode")
+ADDRESS_DIR = os.path.join(BUILD_DIR, "contract_address")
+ADDRESSES_FILE = os.path.join(ADDRESS_DIR, "addresses.txt")
+# hash of the bytecode deployed at each address of addresses.txt, used by --diff
+BYTECODE_HASHES_FILE = os.path.join(ADDRESS_DIR, "bytecode_hashes.txt")
+PACKED_DIR = os.path.dirname(PACKED_FILE)
+INDEX_DIR = os.path.dirname(INDEX_FILE)
+# directories copied into each consumer directory
+SYNCED_DIRS = (ABI_DIR, ADDRESS_DIR, PACKED_DIR, INDEX_DIR)
+# directories of the consumers, each receives a copy of SYNCED_DIRS
+CONSUMER_DIRS = ["../../backend/backend/services/blockchain/contracts",
+                 "../../quorum-event-parser/contracts"]
+
+
+def file_digest(path):
+    """
+    Returns the sha256 of a file, or None if it does not exist.
+    """
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomic(path, data):
+    """
+    Writes data (str or bytes) to a temporary file next to path and renames it over path.
+    """
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, 'wb' if isinstance(data, bytes) else 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ArtifactPublisher:
+
+    def __init__(self, consumer_dirs=None):
+        """
+        :param consumer_dirs: directories receiving a copy of SYNCED_DIRS, CONSUMER_DIRS by default
+        """
+        self.consumer_dirs = CONSUMER_DIRS if consumer_dirs is None else consumer_dirs
+        self._created_dirs = set()
+
+    def ensure_dir(self, directory):
+        if directory not in self._created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._created_dirs.add(directory)
+
+    def write(self, path, data):
+        """
+        Atomically writes data to path, creating its directory if needed.
+        """
+        self.ensure_dir(os.path.dirname(path))
+        write_atomic(path, data)
+
+    def write_packed(self, compiled_contracts):
+        """
+        Writes the packed bundle of all the compiled contracts, unless it is already up to date.
+        :return: True if the bundle was written
+        """
+        return self.write_if_changed(PACKED_FILE, pack(compiled_contracts))
+
+    def write_index(self, compiled_contracts, contract_addresses):
+        """
+        Writes the topic and selector index of the compiled contracts deployed at contract_addresses.
+        :return: True if the index was written
+        """
+        index = build_index(compiled_contracts, contract_addresses)
+        return self.write_if_changed(INDEX_FILE, json.dumps(index, separators=(',', ':'), sort_keys=True).encode())
+
+    def write_if_changed(self, path, data):
+        """
+        Atomically writes data (bytes) to path, unless path already holds exactly data.
+        :return: True if the file was written
+        """
+        if os.path.isfile(path) and os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+        self.write(path, data)
+        return True
+
+    def sync(self, source_dir, destination_dir):
+        """
+        Mirrors the files of source_dir into destination_dir, copying only the files whose content differs and then
+        removing the files which are not in source_dir anymore.
+        :return: number of files copied
+        """
+        self.ensure_dir(destination_dir)
+        names = set(os.listdir(source_dir)) if os.path.isdir(source_dir) else set()
+        copied = 0
+        for name in sorted(names):
+            source = os.path.join(source_dir, name)
+            if not os.path.isfile(source) or name.endswith(".tmp"):
+                continue
+            destination = os.path.join(destination_dir, name)
+            if file_digest(source) == file_digest(destination):
+                continue
+            with open(source, 'rb') as f:
+                write_atomic(destination, f.read())
+            copied += 1
+        for name in os.listdir(destination_dir):
+            path = os.path.join(destination_dir, name)
+            if name not in names and os.path.isfile(path):
+                os.remove(path)
+        return copied
+
+    def publish(self):
+        """
+        Syncs SYNCED_DIRS into every consumer directory.
+        :return: number of files copied
+        """
+        copied = 0
+        for consumer_dir in self.consumer_dirs:
+            for source_dir in SYNCED_DIRS:
+                copied += self.sync(source_dir, os.path.join(consumer_dir, os.path.basename(source_dir)))
+        return copied
@@ -0,0 +1,363 @@
+"""
+asyncio based entry point of the deployer.
+
+The node is reached over a WAN, so every request of the synchronous deployer pays a full round trip and nothing
+else happens meanwhile. This entry point talks to the node through a pooled keep-alive aiohttp session and lets the
+independent steps overlap:
+   1. compilation runs in a worker thread while the chain id, the nonce and the gas price are read
+   2. all the constructors are estimated, signed and sent concurrently, their receipts are polled concurrently
+   3. addresses.txt and the backend copies are written while the wiring transactions are in flight
+
+It produces the same addresses.txt and ABI artifacts as deployer.main(). It does not import deployer.py, whose
+import connects a web3 provider to the node: the contracts, the wiring and the artifact records come from
+deployment.py, and the only options are the ones implemented here.
+
+Usage: python3 async_deployer.py [--parallel-compile]
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+from time import perf_counter
+
+import aiohttp
+from eth_account import Account
+from web3 import Web3
+
+import deployment
+from artifacts import ArtifactPublisher
+from deployment import logger, CONTRACTS, SKIPPED_CONTRACTS, gas_key
+from gas_strategy import GasStrategy
+from nonce_manager import is_known_transaction
+from profiler import Profiler
+
+# only encodes the constructors and the setters, it is never connected to a node
+ENCODER = Web3()
+
+
+class AsyncRpc:
+    """
+    Minimal JSON-RPC client over a pooled keep-alive aiohttp session.
+    """
+
+    def __init__(self, url, pool_size=32, timeout=60):
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+        self._session = aiohttp.ClientSession(connector=connector,
+                                              timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def request(self, method, params):
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+        async with self._session.post(self.url, json=payload) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        if "error" in data:
+            raise ValueError(data["error"])
+        return data.get("result")
+
+    async def batch_request(self, calls):
+        """
+        Sends several calls in a single JSON-RPC batch.
+        :param calls: list of (method, params) tuples
+        :return: list with the raw result of each call, in the order of calls
+        """
+        if not calls:
+            return []
+        ids = [next(self._ids) for _ in calls]
+        payload = [{"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+                   for request_id, (method, params) in zip(ids, calls)]
+        async with self._session.post(self.url, json=payload) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        responses = {item.get("id"): item for item in data}
+        results = []
+        for request_id in ids:
+            item = responses.get(request_id, {"error": "no response for request %s" % request_id})
+            if "error" in item:
+                raise ValueError(item["error"])
+            results.append(item.get("result"))
+        return results
+
+
+class AsyncReceiptPoller:
+    """
+    Waits for the receipts of all the pending transactions with a single poller, which asks for all of them in one
+    JSON-RPC batch per poll, like the fallback poller of ReceiptTracker.
+    """
+
+    def __init__(self, rpc, poll_latency=0.5):
+        self.rpc = rpc
+        self.poll_latency = poll_latency
+        self._pending = {}
+        self._task = None
+
+    async def wait(self, tx_hash, timeout=120):
+        """
+        :return: the raw receipt of the transaction returned by the node
+        :raise TimeoutError: if the transaction is not mined after timeout seconds
+        """
+        tx_hash = tx_hash.lower()
+        future = self._pending.get(tx_hash)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[tx_hash] = future
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(tx_hash, None)
+            raise TimeoutError("transaction %s not mined after %s seconds" % (tx_hash, timeout))
+
+    async def _poll(self):
+        while self._pending:
+            tx_hashes = sorted(self._pending)
+            try:
+                receipts = await self.rpc.batch_request([("eth_getTransactionReceipt", [tx_hash])
+                                                         for tx_hash in tx_hashes])
+            except (aiohttp.ClientError, ValueError) as e:
+                logger.warning("receipt poll failed: %s", e)
+                receipts = [None] * len(tx_hashes)
+            for tx_hash, receipt in zip(tx_hashes, receipts):
+                if receipt is not None:
+                    future = self._pending.pop(tx_hash)
+                    if not future.done():
+                        future.set_result(receipt)
+            if self._pending:
+                await asyncio.sleep(self.poll_latency)
+
+
+class AsyncSender:
+    """
+    Signs and sends the transactions of an account with locally allocated nonces. A nonce whose transaction could not
+    be signed or was rejected is given back and handed out again first, as NonceManager.release does, so that it does
+    not leave a gap holding back the following transactions.
+    """
+
+    def __init__(self, rpc, account, gas_strategy, chain_id, nonce, gas_price):
+        self.rpc = rpc
+        self.account = account
+        self.gas_strategy = gas_strategy
+        self.chain_id = chain_id
+        self.nonce = nonce
+        self.gas_price = gas_price
+        # nonces taken but given back unused
+        self._released = []
+
+    async def gas_limit(self, key, transaction):
+        """
+        Returns the gas limit chosen by the gas strategy, the estimate it asks for is awaited here.
+        """
+        gas_limit = self.gas_strategy.gas_limit(key, lambda: None)
+        if gas_limit is None:
+            gas_limit = int(await self.rpc.request("eth_estimateGas", [transaction]), 16)
+        return gas_limit
+
+    def next_nonce(self):
+        if self._released:
+            return heapq.heappop(self._released)
+        nonce = self.nonce
+        self.nonce += 1
+        return nonce
+
+    def release(self, nonce):
+        if self.nonce == nonce + 1:
+            self.nonce = nonce
+        else:
+            heapq.heappush(self._released, nonce)
+
+    async def send(self, key, data, to=None):
+        """
+        Sends a transaction of the account.
+        The nonce is only taken once the gas limit is known, so a failed estimate does not leave a gap, and a
+        transaction which cannot be signed or is rejected by the node gives its nonce back.
+        :param key: name of the function, used to look up its learned gas limit
+        :param data: hex encoded call data or init code
+        :param to: address of the contract to call, None for a deployment
+        :return: hex hash of the transaction
+        """
+        call = {"from": self.account.address, "data": data}
+        if to is not None:
+            call["to"] = to
+        gas_limit = await self.gas_limit(key, call)
+        nonce = self.next_nonce()
+        transaction = {
+            "nonce": nonce,
+            "gasPrice": self.gas_price,
+            "gas": gas_limit,
+            "data": data,
+            "value": 0,
+            "chainId": self.chain_id,
+        }
+        if to is not None:
+            transaction["to"] = to
+        try:
+            signed_transaction = self.account.signTransaction(transaction)
+        except Exception:
+            self.release(nonce)
+            raise
+        try:
+            return await self.rpc.request("eth_sendRawTransaction", [Web3.toHex(signed_transaction.rawTransaction)])
+        except ValueError as e:
+            if is_known_transaction(e):
+                return Web3.toHex(signed_transaction.hash)
+            self.release(nonce)
+            raise
+
+
+async def deploy_all_contracts(sender, receipts, compiled_contracts, contract_addresses, admin_address,
+                               manager_address):
+    """
+    Deploys every contract of CONTRACTS concurrently.
+    :param receipts: AsyncReceiptPoller waiting for the receipts
+    :param admin_address: address of the admin account, passed to the constructors
+    :param manager_address: address of the manager account, passed to the constructors
+    :return: contract_addresses updated with the new addresses
+    """
+    contracts = [contract for contract in CONTRACTS if contract not in SKIPPED_CONTRACTS]
+
+    async def deploy(contract):
+        abi = compiled_contracts.get(contract).get('abi')
+        bytecode = compiled_contracts.get(contract).get('bin')
+        constructor = ENCODER.eth.contract(abi=abi, bytecode=bytecode).constructor(admin_address, manager_address)
+        tx_hash = await sender.send(gas_key(contract, "constructor", bytecode),
+                                    constructor.data_in_transaction)
+        logger.debug("deployment of %s sent in transaction %s", contract, tx_hash)
+        return await receipts.wait(tx_hash)
+
+    deployed = await asyncio.gather(*[deploy(contract) for contract in contracts])
+    failed = []
+    for contract, receipt in zip(contracts, deployed):
+        sender.gas_strategy.record(gas_key(contract, "constructor", compiled_contracts.get(contract).get('bin')),
+                                   {'status': int(receipt['status'], 16), 'gasUsed': int(receipt['gasUsed'], 16)})
+        # geth fills contractAddress even when the creation reverted or ran out of gas
+        if int(receipt['status'], 16) != 1 or receipt.get('contractAddress') is None:
+            logger.error("deployment of %s failed in transaction %s", contract, receipt['transactionHash'])
+            failed.append(contract)
+            continue
+        contract_addresses[contract] = Web3.toChecksumAddress(receipt['contractAddress'])
+        logger.info('address for contract named %s is %s', contract, contract_addresses[contract])
+    if failed:
+        raise Exception("contract deployment failed for %s" % ", ".join(failed))
+    return contract_addresses
+
+
+async def execute_wiring(sender, receipts, edges, contract_addresses, compiled_contracts):
+    """
+    Sends every wiring edge concurrently and waits for all the receipts.
+    :param receipts: AsyncReceiptPoller waiting for the receipts
+    """
+
+    async def wire(target, setter, address):
+        contract = ENCODER.eth.contract(abi=compiled_contracts.get(target).get('abi'))
+        data = contract.encodeABI(fn_name=setter, args=[address])
+        tx_hash = await sender.send(gas_key(target, setter), data, to=contract_addresses.get(target))
+        return await receipts.wait(tx_hash)
+
+    wired = await asyncio.gather(*[wire(target, setter, address) for target, setter, address, _ in edges])
+    failed = []
+    for (target, setter, address, message), receipt in zip(edges, wired):
+        status = int(receipt['status'], 16)
+        sender.gas_strategy.record(gas_key(target, setter),
+                                   {'status': status, 'gasUsed': int(receipt['gasUsed'], 16)})
+        if status != 1:
+            logger.error("wiring %s.%s(%s) reverted in transaction %s", target, setter, address,
+                         receipt['transactionHash'])
+            failed.append("%s.%s(%s)" % (target, setter, address))
+    if failed:
+        raise Exception("wiring failed for " + ", ".join(failed))
+
+
+def write_contract_addresses(artifacts, contract_addresses, compiled_contracts):
+    deployment.save_contract_addresses(artifacts, contract_addresses, compiled_contracts)
+    deployment.save_bytecode_hashes(artifacts, [contract for contract in CONTRACTS
+                                                if contract not in SKIPPED_CONTRACTS], compiled_contracts)
+    copied = artifacts.publish()
+    logger.info("%d artifact files published to %s", copied, ", ".join(artifacts.consumer_dirs))
+
+
+async def run(config, parallel_compile=False):
+    """
+    Compiles, deploys and wires the contracts.
+    :param config: content of config.json
+    :param parallel_compile: compile the import graph unit by unit in a process pool
+    """
+    loop = asyncio.get_running_loop()
+    start_time = perf_counter()
+    deployment.install_solc(config["solcVersion"])
+    artifacts = ArtifactPublisher()
+    admin_account = Account.from_key(config['adminAccount'])
+    manager_account = Account.from_key(config['managerAccount'])
+    owner_account = Account.from_key(config['ownerAccount'])
+    # gas limits are learned from the receipts, the gas price is read once by run
+    gas_strategy = GasStrategy(None, mode=config.get("gasStrategy", "learned"),
+                               price_ttl=config.get("gasPriceTtl", 60),
+                               default_gas_limit=config.get("defaultGasLimit", 8000000))
+    async with AsyncRpc("http://" + config["nodeHost"] + ":" + config["nodePort"]) as rpc:
+        print("Compiling contracts")
+        compile_task = loop.run_in_executor(None, deployment.compile_contracts, config["solcVersion"], artifacts,
+                                            Profiler(), parallel_compile)
+        chain_id, nonce, gas_price = await asyncio.gather(
+            rpc.request("eth_chainId", []),
+            rpc.request("eth_getTransactionCount", [owner_account.address, "pending"]),
+            rpc.request("eth_gasPrice", []))
+        sender = AsyncSender(rpc, owner_account, gas_strategy, int(chain_id, 16), int(nonce, 16), int(gas_price, 16))
+        receipts = AsyncReceiptPoller(rpc)
+        compiled_contracts = await compile_task
+        print("Contracts compiled")
+
+        print("Deploying contract")
+        contract_addresses = await deploy_all_contracts(sender, receipts, compiled_contracts,
+                                                        deployment.load_contract_addresses(),
+                                                        admin_account.address, manager_account.address)
+        print("Contracts deployed")
+        logger.info(contract_addresses)
+        print(json.dumps(contract_addresses))
+
+        print("instantiating")
+        write_task = loop.run_in_executor(None, write_contract_addresses, artifacts, contract_addresses,
+                                          compiled_contracts)
+        await execute_wiring(sender, receipts, deployment.resolve_wiring(contract_addresses, manager_account.address),
+                             contract_addresses, compiled_contracts)
+        await write_task
+        gas_strategy.save()
+        print("total execution time: %.2fs" % (perf_counter() - start_time))
+        block_number = await rpc.request("eth_blockNumber", [])
+        print("last mined block after instantiation was ", int(block_number, 16))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Deploy and wire the KDA contracts with concurrent requests")
+    parser.add_argument("--parallel-compile", action="store_true",
+                        help="compile independent units of the import graph in a process pool")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.setLevel(logging.DEBUG)
+    file_handler = logging.FileHandler("logs.log")
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(file_handler)
+    logger.info("Contract deployment started")
+    with open("config.json", "r") as config_file:
+        config = json.load(config_file)
+    asyncio.run(run(config, parallel_compile=args.parallel_compile))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+JSON-RPC batching for the deployer.
+
+Every call of web3 is a separate HTTP POST. Read calls which are independent of each other (receipt lookups,
+getCode checks, nonce and balance reads, blockNumber) can travel together as a single JSON-RPC batch array, which
+costs one round trip instead of one per call. BatchHTTPProvider is a drop in replacement of HTTPProvider with an
+extra make_batch_request method, and batch_request sends a list of calls through it.
+"""
+
+import itertools
+import json
+
+from web3 import HTTPProvider, Web3
+from web3._utils.request import make_post_request
+from web3.datastructures import AttributeDict
+
+# fields of a receipt returned by the node as hex quantities
+RECEIPT_INTEGER_FIELDS = ("blockNumber", "cumulativeGasUsed", "gasUsed", "status", "transactionIndex",
+                          "effectiveGasPrice", "type")
+
+
+class BatchHTTPProvider(HTTPProvider):
+
+    _batch_ids = itertools.count(1)
+
+    def make_batch_request(self, calls):
+        """
+        Sends several JSON-RPC calls in a single HTTP request.
+        :param calls: list of (method, params) tuples
+        :return: list with the raw result of each call, in the order of calls
+        """
+        if not calls:
+            return []
+        ids = [next(self._batch_ids) for _ in calls]
+        payload = [{"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+                   for request_id, (method, params) in zip(ids, calls)]
+        raw_response = make_post_request(self.endpoint_uri, json.dumps(payload).encode(), **self.get_request_kwargs())
+        responses = self.decode_rpc_response(raw_response)
+        if isinstance(responses, dict):
+            # the node answers a batch it does not accept with a single error object
+            raise ValueError(responses.get("error", responses))
+        by_id = {response.get("id"): response for response in responses}
+        results = []
+        for request_id, (method, params) in zip(ids, calls):
+            response = by_id.get(request_id)
+            if response is None:
+                raise ValueError("no response to %s in the batch" % method)
+            if "error" in response:
+                raise ValueError(response["error"])
+            results.append(response.get("result"))
+        return results
+
+
+def batch_request(w3, calls):
+    """
+    Sends calls as a single batch when the provider of w3 supports it, or one by one otherwise.
+    :param w3: web3 instance
+    :param calls: list of (method, params) tuples
+    :return: list with the raw result of each call
+    """
+    if hasattr(w3.provider, "make_batch_request"):
+        return w3.provider.make_batch_request(calls)
+    results = []
+    for method, params in calls:
+        response = w3.provider.make_request(method, params)
+        if "error" in response:
+            raise ValueError(response["error"])
+        results.append(response.get("result"))
+    return results
+
+
+def format_receipt(receipt):
+    """
+    Converts a raw receipt, as returned in a batch, into the form returned by w3.eth.getTransactionReceipt for the
+    fields used by the deployer.
+    """
+    if receipt is None:
+        return None
+    formatted = dict(receipt)
+    for field in RECEIPT_INTEGER_FIELDS:
+        if isinstance(formatted.get(field), str):
+            formatted[field] = int(formatted[field], 16)
+    if formatted.get("contractAddress"):
+        formatted["contractAddress"] = Web3.toChecksumAddress(formatted["contractAddress"])
+    return AttributeDict(formatted)
@@ -0,0 +1,207 @@
+"""
+Offline signed deployment bundles.
+
+plan: compiles the contracts, computes every deployment and wiring transaction with fixed nonces and gas limits,
+signs them all in a process pool and writes them to a bundle file. The addresses of the contracts follow from the
+nonces of their deployments, so the wiring transactions can be signed before anything is deployed.
+
+plan only reads the node for the values which are not given: with --nonce, --chain-id and --gas-price it runs
+offline. It imports deployment.py, not deployer.py, which connects to the node as soon as it is imported.
+
+apply: streams the raw signed transactions of a bundle to the node back to back, waits for all the receipts, writes
+addresses.txt, the bytecode hashes, the ABIs and the topic index, and publishes them to the backend and the event
+parser like deployer.py does. It needs neither the keys nor solc, only the bundle and the node, so a release can be
+planned on a fast machine and pushed from a bastion host.
+
+Usage:
+    python3 bundle.py plan [--nonce N] [--chain-id ID] [--gas-price WEI] [--output FILE]
+    python3 bundle.py apply FILE [--node http://host:port]
+"""
+
+import argparse
+import datetime
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_account import Account
+from web3 import Web3
+
+import deployment
+from artifacts import ArtifactPublisher, ABI_DIR, BYTECODE_HASHES_FILE
+from batch_provider import BatchHTTPProvider, batch_request
+from create2 import create_address
+from gas_strategy import GasStrategy
+from profiler import Profiler
+from receipt_tracker import ReceiptTracker, hex_hash
+
+BUNDLE_DIR = "../build/bundles"
+# number of raw transactions sent per JSON-RPC batch by apply
+SEND_BATCH_SIZE = 50
+
+
+def sign_transaction(transaction, private_key):
+    """
+    Signs a transaction. Runs inside a worker process of plan.
+    :return: tuple (hex hash, hex raw transaction)
+    """
+    signed_transaction = Account.sign_transaction(transaction, private_key)
+    return Web3.toHex(signed_transaction.hash), Web3.toHex(signed_transaction.rawTransaction)
+
+
+def load_config():
+    with open("config.json", "r") as config_file:
+        return json.load(config_file)
+
+
+def config_node_url(config):
+    return "http://" + config["nodeHost"] + ":" + config["nodePort"]
+
+
+def plan(nonce=None, output=None, parallel_compile=False, chain_id=None, gas_price=None):
+    """
+    Writes a bundle with the signed deployment and wiring transactions of every contract of CONTRACTS.
+    :param nonce: first nonce of the bundle, read from the node if not given
+    :param output: bundle file, ../build/bundles/<timestamp>.json by default
+    :param chain_id: chain id of the transactions, read from the node if not given
+    :param gas_price: gas price of the transactions, read from the node if not given
+    :return: path of the bundle
+    """
+    config = load_config()
+    owner_account = Account.from_key(config['ownerAccount'])
+    admin_account = Account.from_key(config['adminAccount'])
+    manager_account = Account.from_key(config['managerAccount'])
+    # the node is only reached for the values which are not given
+    w3 = Web3(BatchHTTPProvider(config_node_url(config))) if None in (nonce, chain_id, gas_price) else Web3()
+    gas_strategy = GasStrategy(w3, mode=config.get("gasStrategy", "learned"), price_ttl=config.get("gasPriceTtl", 60),
+                               default_gas_limit=config.get("defaultGasLimit", 8000000))
+
+    deployment.install_solc(config["solcVersion"])
+    compiled_contracts = deployment.compile_contracts(config["solcVersion"], ArtifactPublisher(), Profiler(),
+                                                      parallel_compile)
+    if nonce is None:
+        nonce = w3.eth.getTransactionCount(owner_account.address, 'pending')
+    if chain_id is None:
+        chain_id = w3.eth.chainId
+    if gas_price is None:
+        gas_price = gas_strategy.gas_price()
+
+    def parameters(key):
+        return {'from': owner_account.address, 'gas': gas_strategy.known_gas_limit(key), 'gasPrice': gas_price,
+                'chainId': chain_id, 'nonce': nonce + len(steps)}
+
+    # (description, gas key, transaction)
+    steps = []
+    contract_addresses = deployment.load_contract_addresses()
+    contracts = [contract for contract in deployment.CONTRACTS if contract not in deployment.SKIPPED_CONTRACTS]
+    for contract in contracts:
+        constructor = w3.eth.contract(abi=compiled_contracts.get(contract).get('abi'),
+                                      bytecode=compiled_contracts.get(contract).get('bin')).constructor(
+            admin_account.address, manager_account.address)
+        key = deployment.gas_key(contract, "constructor", compiled_contracts.get(contract).get('bin'))
+        transaction = constructor.buildTransaction(parameters(key))
+        contract_addresses[contract] = create_address(owner_account.address, transaction['nonce'])
+        steps.append(("deploy " + contract, key, transaction))
+    for target, setter, address, message in deployment.resolve_wiring(contract_addresses, manager_account.address):
+        target_contract = w3.eth.contract(address=contract_addresses.get(target),
+                                          abi=compiled_contracts.get(target).get('abi'))
+        key = deployment.gas_key(target, setter)
+        steps.append(("%s.%s(%s)" % (target, setter, address), key,
+                      getattr(target_contract.functions, setter)(address).buildTransaction(parameters(key))))
+
+    with ProcessPoolExecutor() as executor:
+        signed = list(executor.map(sign_transaction, [transaction for _, _, transaction in steps],
+                                   [config['ownerAccount']] * len(steps)))
+
+    bundle = {
+        "createdAt": datetime.datetime.now().isoformat(),
+        "chainId": chain_id,
+        "from": owner_account.address,
+        "addresses": contract_addresses,
+        "bytecodeHashes": {contract: deployment.bytecode_hash(compiled_contracts.get(contract).get('bin'))
+                           for contract in contracts},
+        # written by apply with the addresses, so the backend and the event parser get the matching ABIs and index
+        "abis": {contract: value.get('abi') for contract, value in compiled_contracts.items()},
+        "transactions": [{"description": description, "gasKey": key, "nonce": transaction['nonce'],
+                          "hash": tx_hash, "raw": raw}
+                         for (description, key, transaction), (tx_hash, raw) in zip(steps, signed)],
+    }
+    if output is None:
+        output = os.path.join(BUNDLE_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(bundle, f, indent=2)
+    print("bundle with %d transactions written to %s" % (len(steps), output))
+    return output
+
+
+def apply(bundle_file, node_url):
+    """
+    Sends the transactions of a bundle, records the resulting addresses with the ABIs and the topic index of the
+    bundle, and publishes them to the backend and the event parser.
+    :param bundle_file: bundle written by plan
+    :param node_url: http url of the node
+    :return: the addresses of the contracts
+    """
+    with open(bundle_file, 'r') as f:
+        bundle = json.load(f)
+    if "abis" not in bundle:
+        raise Exception("%s has no ABIs to publish with the addresses, plan it again" % bundle_file)
+    w3 = Web3(BatchHTTPProvider(node_url))
+    transactions = bundle["transactions"]
+    if not transactions:
+        print("nothing to apply")
+        return bundle["addresses"]
+    next_nonce = w3.eth.getTransactionCount(bundle["from"], 'pending')
+    if next_nonce != transactions[0]["nonce"]:
+        raise Exception("the bundle starts at nonce %s but the next nonce of %s is %s, plan it again" %
+                        (transactions[0]["nonce"], bundle["from"], next_nonce))
+
+    for start in range(0, len(transactions), SEND_BATCH_SIZE):
+        chunk = transactions[start:start + SEND_BATCH_SIZE]
+        batch_request(w3, [("eth_sendRawTransaction", [transaction["raw"]]) for transaction in chunk])
+    print("%d transactions sent" % len(transactions))
+
+    receipts = ReceiptTracker(w3).wait_all([transaction["hash"] for transaction in transactions])
+    failed = [transaction["description"] for transaction in transactions
+              if receipts[hex_hash(transaction["hash"])]["status"] != 1]
+    if failed:
+        raise Exception("transactions failed: " + ", ".join(failed))
+
+    publisher = ArtifactPublisher()
+    compiled_contracts = {contract: {'abi': abi} for contract, abi in bundle["abis"].items()}
+    for contract, abi in bundle["abis"].items():
+        publisher.write(os.path.join(ABI_DIR, contract + ".abi"), json.dumps(abi))
+    deployment.save_contract_addresses(publisher, bundle["addresses"], compiled_contracts)
+    hashes = deployment.load_bytecode_hashes()
+    hashes.update(bundle["bytecodeHashes"])
+    publisher.write(BYTECODE_HASHES_FILE, json.dumps(hashes))
+    copied = publisher.publish()
+    print("%d artifact files published to %s" % (copied, ", ".join(publisher.consumer_dirs)))
+    print(json.dumps(bundle["addresses"]))
+    return bundle["addresses"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan and apply signed deployment bundles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    plan_parser = subparsers.add_parser("plan", help="compile, build and sign every transaction into a bundle")
+    plan_parser.add_argument("--nonce", type=int, help="first nonce of the bundle, read from the node by default")
+    plan_parser.add_argument("--chain-id", type=int, help="chain id of the transactions, read from the node by default")
+    plan_parser.add_argument("--gas-price", type=int, help="gas price in wei, read from the node by default")
+    plan_parser.add_argument("--output", help="bundle file to write")
+    plan_parser.add_argument("--parallel-compile", action="store_true")
+    apply_parser = subparsers.add_parser("apply", help="send the transactions of a bundle")
+    apply_parser.add_argument("bundle", help="bundle file written by plan")
+    apply_parser.add_argument("--node", help="http url of the node, nodeHost:nodePort of config.json by default")
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        plan(nonce=args.nonce, output=args.output, parallel_compile=args.parallel_compile, chain_id=args.chain_id,
+             gas_price=args.gas_price)
+    else:
+        apply(args.bundle, args.node or config_node_url(load_config()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Compilation helpers for the KDA-TDR deployer.
+
+solc is slow and the contracts change rarely, so the output of every compilation is cached under ../build.
+Each source file gets a key made from the sha256 of its own content and of every file it imports (transitively),
+together with the solc version and the requested output values. If the key of a file matches the one stored in
+the manifest, the ABI and bytecode of the contracts it defines are loaded back from ../build/abi and
+../build/bytecode instead of starting solc.
+
+Files that do need compiling can be split into independent compilation units and compiled in a process pool,
+see compile_parallel.
+"""
+
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import solcx
+
+BUILD_DIR = "../build"
+MANIFEST_FILE = "compiled_contracts/manifest.json"
+
+# matches `import "./X.sol";` and `import {A} from "./X.sol";`, but not commented out imports
+IMPORT_PATTERN = re.compile(r'^\s*import\s+(?:[^"\'\n]*\s+from\s+)?["\']([^"\']+)["\']', re.MULTILINE)
+
+
+def get_imports(path):
+    """
+    Returns the list of files imported by a solidity source file.
+    Relative imports are resolved against the directory of the importing file.
+    :param path: path of the solidity file
+    :return: list of normalised paths of the imported files
+    """
+    with open(path, 'r') as f:
+        source = f.read()
+    imports = []
+    for imported in IMPORT_PATTERN.findall(source):
+        if imported.startswith('.'):
+            imported = os.path.join(os.path.dirname(path), imported)
+        imports.append(os.path.normpath(imported))
+    return imports
+
+
+def build_import_graph(files):
+    """
+    Builds the import graph of the given files and of everything they import.
+    :param files: list of solidity files
+    :return: dictionary with the path of each file as key and the list of its imports as value
+    """
+    graph = {}
+    pending = [os.path.normpath(file) for file in files]
+    while pending:
+        path = pending.pop()
+        if path in graph:
+            continue
+        graph[path] = get_imports(path)
+        pending.extend(graph[path])
+    return graph
+
+
+def dependency_closure(path, graph):
+    """
+    Returns the file and every file it imports, directly or indirectly.
+    """
+    closure = set()
+    pending = [os.path.normpath(path)]
+    while pending:
+        current = pending.pop()
+        if current in closure:
+            continue
+        closure.add(current)
+        pending.extend(graph.get(current, []))
+    return closure
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def source_key(path, graph, solc_version, output_values, file_hashes=None):
+    """
+    Computes the cache key of a source file.
+    The key changes whenever the file, any of its transitive imports, the solc version or the output selection
+    changes.
+    :param path: path of the solidity file
+    :param graph: import graph as returned by build_import_graph
+    :param solc_version: version of solc used for the compilation
+    :param output_values: output values requested from solc
+    :param file_hashes: optional dictionary used to memoise the hash of each file
+    :return: hex digest identifying the compilation output of the file
+    """
+    if file_hashes is None:
+        file_hashes = {}
+    key = hashlib.sha256()
+    key.update(str(solc_version).encode())
+    key.update(json.dumps(sorted(output_values)).encode())
+    for dependency in sorted(dependency_closure(path, graph)):
+        if dependency not in file_hashes:
+            file_hashes[dependency] = file_hash(dependency)
+        key.update(dependency.encode())
+        key.update(file_hashes[dependency].encode())
+    return key.hexdigest()
+
+
+def cache_keys(graph, solc_version, output_values):
+    """
+    Returns the cache key of every file of the import graph.
+    """
+    file_hashes = {}
+    return {path: source_key(path, graph, solc_version, output_values, file_hashes) for path in graph}
+
+
+def load_manifest(build_dir=BUILD_DIR):
+    file = os.path.join(build_dir, MANIFEST_FILE)
+    if not os.path.isfile(file):
+        return {}
+    with open(file, 'r') as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            # a corrupt manifest only costs a full compilation
+            return {}
+
+
+def save_manifest(manifest, build_dir=BUILD_DIR):
+    file = os.path.join(build_dir, MANIFEST_FILE)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(file + '.tmp', file)
+
+
+def load_cached_contract(name, build_dir=BUILD_DIR):
+    """
+    Loads the ABI and bytecode of a contract saved by a previous compilation.
+    :return: dictionary with the abi and bin of the contract, or None if the artifacts are missing
+    """
+    abi_file = os.path.join(build_dir, "abi", name + ".abi")
+    bin_file = os.path.join(build_dir, "bytecode", name + ".bin")
+    if not (os.path.isfile(abi_file) and os.path.isfile(bin_file)):
+        return None
+    with open(abi_file, 'r') as f_abi, open(bin_file, 'r') as f_bin:
+        return {'abi': json.load(f_abi), 'bin': f_bin.read()}
+
+
+def split_cached(graph, manifest, keys, build_dir=BUILD_DIR):
+    """
+    Separates the files whose compilation output is still valid from the ones that need to be recompiled.
+    :param graph: import graph as returned by build_import_graph
+    :param manifest: manifest of the previous compilation
+    :param keys: dictionary with the current cache key of every file of the graph
+    :return: tuple (cached contracts as {name: {abi, bin}}, list of files to recompile)
+    """
+    cached = {}
+    stale_files = []
+    for path in sorted(graph):
+        entry = manifest.get(path)
+        if entry is None or entry.get('key') != keys[path]:
+            stale_files.append(path)
+            continue
+        contracts = {name: load_cached_contract(name, build_dir) for name in entry.get('contracts', [])}
+        if any(value is None for value in contracts.values()):
+            stale_files.append(path)
+            continue
+        cached.update(contracts)
+    return cached, stale_files
+
+
+def update_manifest(manifest, stale_files, keys, compiled_contracts):
+    """
+    Records the output of a compilation in the manifest.
+    :param manifest: manifest to update in place
+    :param stale_files: files that were given to solc
+    :param keys: dictionary with the current cache key of every file
+    :param compiled_contracts: raw solcx output, keyed by "path:ContractName"
+    """
+    # solc may report the source paths in a different form than the one it was given
+    defined = {os.path.abspath(path): [] for path in stale_files}
+    for key in compiled_contracts:
+        path, name = key.rsplit(":", 1)
+        path = os.path.abspath(path)
+        if path in defined and name not in defined[path]:
+            defined[path].append(name)
+    for path in stale_files:
+        manifest[path] = {'key': keys[path], 'contracts': sorted(defined[os.path.abspath(path)])}
+
+
+def compilation_units(files, graph):
+    """
+    Splits a list of files into independent compilation units.
+    A file does not need its own unit if it is already compiled as part of the imports of another file. Files which
+    import each other (same closure) share a single unit.
+    :param files: files to compile
+    :param graph: import graph as returned by build_import_graph
+    :return: list of files, one per unit; compiling all of them produces the output of every file in files
+    """
+    files = sorted(set(os.path.normpath(file) for file in files))
+    closures = {file: dependency_closure(file, graph) for file in files}
+    units = []
+    for file in files:
+        covered = False
+        for other in files:
+            if other == file or file not in closures[other]:
+                continue
+            if closures[file] < closures[other] or (closures[file] == closures[other] and other < file):
+                covered = True
+                break
+        if not covered:
+            units.append(file)
+    return units
+
+
+def compile_unit(path, solc_version, output_values):
+    """
+    Compiles a single unit. Runs inside a worker process of compile_parallel.
+    """
+    return solcx.compile_files([path], output_values=output_values, solc_version=solc_version)
+
+
+def compile_parallel(files, graph, solc_version, output_values, max_workers=None):
+    """
+    Compiles the files unit by unit in a process pool.
+    :param files: files to compile
+    :param graph: import graph as returned by build_import_graph
+    :param solc_version: version of solc to use, it must already be installed
+    :param output_values: output values requested from solc
+    :param max_workers: size of the pool, defaults to the number of cpus of the machine
+    :return: the merged solcx output of all the units, keyed by "path:ContractName"
+    """
+    units = compilation_units(files, graph)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(units)))
+    compiled_contracts = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(compile_unit, unit, solc_version, output_values) for unit in units]
+        for future in futures:
+            # a contract imported by several units is compiled several times with the same result
+            for key, value in future.result().items():
+                compiled_contracts.setdefault(key, value)
+    return compiled_contracts
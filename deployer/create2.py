@@ -0,0 +1,39 @@
+"""
+Address computation for the deterministic deployment mode of the deployer.
+
+The contracts are deployed through the KdaFactory contract (../contracts/KdaFactory.sol) with CREATE2. The salt of
+a contract is derived from its name and from a release tag, so the address of every contract is known before any
+transaction is sent, and the wiring transactions can be signed together with the deployments.
+"""
+
+import rlp
+from web3 import Web3
+
+FACTORY = "KdaFactory"
+
+
+def contract_salt(name, release_tag):
+    """
+    Returns the CREATE2 salt of a contract for a release.
+    """
+    return Web3.keccak(text=str(release_tag) + ":" + name)
+
+
+def create_address(sender, nonce):
+    """
+    Returns the address of the contract deployed by sender with a plain transaction using nonce.
+    """
+    encoded = rlp.encode([bytes.fromhex(sender[2:]), nonce])
+    return Web3.toChecksumAddress(Web3.keccak(encoded)[12:])
+
+
+def create2_address(factory, salt, init_code):
+    """
+    Returns the address at which factory deploys init_code with salt, see KdaFactory.computeAddress.
+    :param factory: address of the factory
+    :param salt: 32 bytes salt
+    :param init_code: bytecode of the contract followed by its abi encoded constructor arguments
+    """
+    init_code = Web3.toBytes(hexstr=init_code) if isinstance(init_code, str) else init_code
+    digest = Web3.keccak(b'\xff' + bytes.fromhex(factory[2:]) + bytes(salt) + Web3.keccak(init_code))
+    return Web3.toChecksumAddress(digest[12:])
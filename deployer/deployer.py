@@ -18,13 +18,26 @@ Currently the order in which the contracts should be deployed is
 
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
+from web3.exceptions import TimeExhausted
 import logging
 import json
-import solcx
-import os
 import datetime
+import argparse
 from time import sleep
 from tests import run_all_test
+from functools import partial
+from nonce_manager import NonceManager
+from gas_strategy import GasStrategy
+from batch_provider import BatchHTTPProvider, batch_request
+from receipt_tracker import ReceiptTracker, hex_hash
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from create2 import FACTORY, contract_salt, create_address, create2_address
+from journal import DeploymentJournal
+from profiler import Profiler
+from artifacts import ArtifactPublisher
+import deployment
+from deployment import (FILES_TO_COMPILE, CONTRACTS, SKIPPED_CONTRACTS, install_solc, gas_key, bytecode_hash,
+                        load_contract_addresses, load_bytecode_hashes)
 
 # Set up the loggig services
 # Create a logger
@@ -55,9 +68,16 @@ PORT = config["nodePort"]
 
 logger.debug("Connecting to blockchain host %s:%s ", HOST, PORT)
 
-# Connect to Quorum node
-w3 = Web3(Web3.HTTPProvider("http://" + HOST + ":" + PORT))
+# spans of the run, recorded with --profile
+PROFILER = Profiler()
+# writes the build outputs atomically and syncs them into the backend and the event parser
+ARTIFACTS = ArtifactPublisher()
+
+# Connect to Quorum node, independent read calls can be sent together as a JSON-RPC batch
+w3 = Web3(BatchHTTPProvider("http://" + HOST + ":" + PORT))
 w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+w3.middleware_onion.add(PROFILER.middleware, "profiler")
+PROFILER.instrument_batches(w3.provider)
 
 # Check if connected
 if w3.isConnected():
@@ -70,51 +90,31 @@ ADMIN_ACCOUNT = w3.eth.account.from_key(config['adminAccount'])
 MANAGER_ACCOUNT = w3.eth.account.from_key(config['managerAccount'])
 OWNER_ACCOUNT = w3.eth.account.from_key(config['ownerAccount'])
 w3.eth.defaultAccount = OWNER_ACCOUNT.address
+# the owner account with its signatures recorded by PROFILER
+OWNER_SIGNER = PROFILER.signer(OWNER_ACCOUNT)
+# receipts are resolved from newHeads over a WebSocket when nodeWsPort is configured, otherwise by a shared poller
+RECEIPT_TRACKER = ReceiptTracker(w3, "ws://" + HOST + ":" + str(config["nodeWsPort"]) if config.get("nodeWsPort")
+                                 else None, logger=logger)
+# every transaction of the deployer is sent by the owner account, its nonces are allocated locally
+NONCE_MANAGER = NonceManager(w3, OWNER_ACCOUNT.address)
+CHAIN_ID = w3.eth.chainId
+# every transaction sent by deploy_all_contracts and execute_wiring is journaled, so a failed run can be resumed
+JOURNAL = DeploymentJournal()
+# steps of the journal already done or in flight, filled by main() with --resume
+RESUMED_STEPS = {}
+# gas price is cached and gas limits are learned from the receipts, see gas_strategy.py
+GAS_STRATEGY = GasStrategy(w3, mode=config.get("gasStrategy", "learned"), price_ttl=config.get("gasPriceTtl", 60),
+                           default_gas_limit=config.get("defaultGasLimit", 8000000))
 # settin the solcx latest version
-logger.debug("setting solc version to %s", SOLC_VERSION)
-solcx.install_solc(SOLC_VERSION)
-solcx.set_solc_version(SOLC_VERSION)
-
-FILES_TO_COMPILE = [
-    "../contracts/DataTypes.sol",
-    "../contracts/TDR.sol",
-    "../contracts/DRC.sol",
-    "../contracts/Application.sol",
-    "../contracts/DRCManager.sol",
-    "../contracts/TDRManager.sol",
-    "../contracts/UserManager.sol",
-    "../contracts/UtilizationApplication.sol",
-    "../contracts/nomineeStorage.sol",
-    "../contracts/nomineeManager.sol",
-    "../contracts/DucStorage.sol",
-    "../contracts/UserStorage.sol"
-]
-CONTRACTS = ["DrcTransferApplicationStorage", "DrcStorage", "DRCManager", "TdrStorage", "TDRManager", "UserManager",
-             "DuaStorage", "NomineeStorage", "NomineeManager", "DucStorage", "UserStorage"]
-# SKIPPED_CONTRACTS = ["UserManager","TdrStorage","DrcStorage","NomineeStorage"]
-# SKIPPED_CONTRACTS = ["UserStorage", "TdrStorage", "NomineeStorage"]
-# SKIPPED_CONTRACTS = [
-#                     "DrcTransferApplicationStorage",
-#                      "DrcStorage",
-#                      # "DRCManager",
-#                      "TdrStorage",
-#                      "TDRManager",
-#                      "UserManager",
-#                      "DuaStorage",
-#                      "NomineeStorage",
-#                      "NomineeManager",
-#                      "UserStorage",
-#                      ]
-SKIPPED_CONTRACTS = []
+install_solc(SOLC_VERSION)
+
 logger.info('following files would be compiled')
 logger.info(FILES_TO_COMPILE)
 
 
 def save_compiled_contracts(compiled_contracts):
     file = "../build/compiled_contracts/compiled_contracts.txt"
-    os.system("mkdir -p ../build/compiled_contracts")
-    f = open(file, 'w+')
-    f.write(json.dumps(compiled_contracts))
+    ARTIFACTS.write(file, json.dumps(compiled_contracts))
 
 
 def get_previous_contracts():
@@ -125,32 +125,14 @@ def get_previous_contracts():
     return compiled_contracts
 
 
-def get_compiled_contracts():
+def get_compiled_contracts(parallel=False):
     """
-    This function returns a dictionary of all the compiled contracts, their ABI and bytecode.
-    It uses the solcx library to compile the contracts specified in the FILES_TO_COMPILE variable.
-    The returned dictionary has the
-    contract name as the key and a dictionary containing the ABI and bytecode as the value.
-    Additionally, it saves the contracts to the local storage using the save_contract function.
+    Compiles the contracts of FILES_TO_COMPILE with SOLC_VERSION, reusing the cached build, see
+    deployment.compile_contracts.
+    :param parallel: compile the import graph unit by unit in a process pool instead of a single solc invocation
     :return: A dictionary with contract name as the key and a dictionary containing the ABI and bytecode as the value.
     """
-
-    _compiled_contracts = solcx.compile_files(FILES_TO_COMPILE,
-                                              output_values=["abi", "bin"])
-    # Formatting dictionary
-    compiled_contracts = {}
-    # compiled_contracts = get_previous_contracts()
-    # print("###############################################")
-    # print("WARNING: Using previous contracts, this may lead to error")
-    # print("###############################################")
-    for key in _compiled_contracts.keys():
-        value = _compiled_contracts.get(key)
-        print(key)
-        new_key = key.split(":")[1]
-        compiled_contracts[new_key] = value
-        save_contract(new_key, value)
-    # save_compiled_contracts(compiled_contracts)
-    return compiled_contracts
+    return deployment.compile_contracts(SOLC_VERSION, ARTIFACTS, PROFILER, parallel)
 
 
 def log_dict(d, s=1):
@@ -166,75 +148,92 @@ def log_dict(d, s=1):
             logger.debug('  ' * s, d.get(key))
 
 
-def save_contract(key, value):
-    """
-    This function saves the ABI and bytecode of a contract to the local storage.
-    The ABI is saved in a file named "{key}.abi" in the "../build/abi/" directory,
-    and the bytecode is saved in a file named "{key}.bin" in the "../build/bytecode/" directory.
-    :param key: The name of the contract
-    :param value: A dictionary containing the ABI and bytecode of the contract
-    """
-    os.system("mkdir -p ../build/abi")
-    os.system("mkdir -p ../build/bytecode")
-    f_abi = open("../build/abi/" + key + ".abi", 'w+')
-    f_bin = open("../build/bytecode/" + key + ".bin", 'w+')
-    # logger.debug(type(value.get('abi')))
-    # logger.debug(json.dumps(value.get('abi')))
-    f_abi.write(json.dumps(value.get('abi')))
-    f_abi.close()
-
-    f_bin.write(value.get('bin'))
-    f_bin.close()
-
-
-def deploy_contract(abi, bytecode):
+def build_deploy_transaction(abi, bytecode, nonce, name=None):
     """
-    This function deploys a contract to the Ethereum network.
-    It takes in the ABI and bytecode of the contract and uses them to create a contract instance.
-    It estimates the gas required for the deployment and builds the deployment transaction.
-    The deployment transaction is signed by the owner account and sent to the Ethereum network.
-    The function returns the address of the deployed contract.
+    Builds the constructor transaction of a contract, without signing or sending it.
+    Gas price and gas limit are chosen by GAS_STRATEGY.
     :param abi: The ABI of the contract
     :param bytecode: The bytecode of the contract
-    :return: The address of the deployed contract.
+    :param nonce: nonce of the owner account to use for the transaction
+    :param name: name of the contract, used to look up its learned gas limit
+    :return: the transaction dictionary
     """
     contract = w3.eth.contract(abi=abi, bytecode=bytecode)
-    gas_estimate = contract.constructor(ADMIN_ACCOUNT.address, MANAGER_ACCOUNT.address).estimateGas()
-    print("gas estimate is ", gas_estimate)
-    transaction = contract.constructor(ADMIN_ACCOUNT.address, MANAGER_ACCOUNT.address).buildTransaction({
+    constructor = contract.constructor(ADMIN_ACCOUNT.address, MANAGER_ACCOUNT.address)
+    gas_limit = GAS_STRATEGY.gas_limit(gas_key(name, "constructor", bytecode), constructor.estimateGas)
+    print("gas limit is ", gas_limit)
+    return constructor.buildTransaction({
         'from': OWNER_ACCOUNT.address,
-        'gas': gas_estimate,
-        'gasPrice': w3.eth.gasPrice,
-        'nonce': w3.eth.getTransactionCount(OWNER_ACCOUNT.address)
+        'gas': gas_limit,
+        'gasPrice': GAS_STRATEGY.gas_price(),
+        'nonce': nonce
     })
-    signed_transaction = OWNER_ACCOUNT.signTransaction(transaction)
 
-    # Send the signed transaction
-    tx_hash = w3.eth.sendRawTransaction(signed_transaction.rawTransaction)
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    contract_address = tx_receipt['contractAddress']
-    if contract_address is None:
-        raise Exception("contract deployment failed")
-    return contract_address
+
+def wait_for_receipts(tx_hashes, timeout=120):
+    """
+    Waits for the receipts of several transactions at once.
+    Receipts are collected in whatever order the transactions get mined, so the total wait is roughly the time to
+    mine the slowest transaction instead of the sum of all of them. They are resolved by RECEIPT_TRACKER, from the
+    new blocks of the node or from a single poller shared by all the pending transactions.
+    :param tx_hashes: iterable of transaction hashes
+    :param timeout: seconds to wait before giving up
+    :return: dictionary with the hex transaction hash as key and the receipt as value
+    """
+    tx_hashes = list(tx_hashes)
+    try:
+        with PROFILER.span("wait for %d receipts" % len(tx_hashes), "wait"):
+            return RECEIPT_TRACKER.wait_all(tx_hashes, timeout=timeout)
+    except FutureTimeoutError as e:
+        raise TimeExhausted(str(e))
+
+
+def save_bytecode_hashes(contracts, compiled_contracts):
+    """
+    Records the hash of the bytecode deployed for each contract, next to addresses.txt
+    :param contracts: names of the contracts deployed by this run
+    :param compiled_contracts: dictionary of the compiled contracts, with their abi and bytecode
+    """
+    deployment.save_bytecode_hashes(ARTIFACTS, contracts, compiled_contracts)
 
 
-def deploy_all_contracts(compiled_contracts):
+def find_changed_contracts(compiled_contracts, contract_addresses):
+    """
+    Finds the contracts which have to be deployed again.
+    A contract is kept if the hash of its compiled bytecode matches the one recorded when it was deployed and
+    the node still has code at its address. All the getCode checks are sent in a single batch.
+    :param compiled_contracts: dictionary of the compiled contracts, with their abi and bytecode
+    :param contract_addresses: addresses of the previous deployment
+    :return: list of the names of the contracts to deploy
+    """
+    hashes = load_bytecode_hashes()
+    candidates = [contract for contract in CONTRACTS
+                  if contract in contract_addresses
+                  and hashes.get(contract) == bytecode_hash(compiled_contracts.get(contract).get('bin'))]
+    codes = batch_request(w3, [("eth_getCode", [contract_addresses[contract], "latest"]) for contract in candidates])
+    unchanged = [contract for contract, code in zip(candidates, codes) if code not in (None, "0x", "0x0")]
+    for contract in unchanged:
+        logger.info("contract %s is unchanged, keeping %s", contract, contract_addresses[contract])
+    return [contract for contract in CONTRACTS if contract not in unchanged]
+
+
+def deploy_all_contracts(compiled_contracts, contracts=None):
     """
     Deploys all the contracts
+    The constructors do not depend on each other, so the transactions of all the contracts are signed with
+    consecutive nonces from NONCE_MANAGER, sent back to back and then the receipts are waited for together.
+    Every transaction is recorded in JOURNAL; deployments found in RESUMED_STEPS with the same bytecode are not sent
+    again.
     :param compiled_contracts: a dictionary objcet containing all the compiled contracts, with their abi and bytecode
+    :param contracts: names of the contracts to deploy, all the CONTRACTS by default
     :return: contract_address: a dictionary containing contract name as key mapped with their address
     """
     # Getting the old deployment
-    file = "../build/contract_address/addresses.txt"
-    if os.path.isfile(file):
-        f = open(file, 'r')
-        contract_addresses = json.loads(f.read())
-        f.close()
-    else:
-        if os.path.isdir("../build/contract_address") is False:
-            os.system("mkdir -p ../build/contract_address")
-        contract_addresses = {}
-    for contract in CONTRACTS:
+    contract_addresses = load_contract_addresses()
+    if contracts is None:
+        contracts = CONTRACTS
+    tx_hashes = {}
+    for contract in contracts:
         # skip few contracts
         logger.debug("deploying contract: %s", contract)
         if SKIPPED_CONTRACTS.count(contract) != 0:
@@ -242,211 +241,422 @@ def deploy_all_contracts(compiled_contracts):
             continue
         abi = compiled_contracts.get(contract).get('abi')
         bytecode = compiled_contracts.get(contract).get('bin')
-        address = deploy_contract(abi, bytecode)
+        resumed = RESUMED_STEPS.get("deploy:" + contract)
+        if resumed is not None and resumed.get("bytecodeHash") == bytecode_hash(bytecode):
+            if resumed["state"] == "mined":
+                contract_addresses[contract] = resumed["contractAddress"]
+                logger.info("contract %s was deployed at %s by the resumed run", contract, resumed["contractAddress"])
+            else:
+                tx_hashes[contract] = hex_hash(resumed["txHash"])
+                logger.info("waiting for the deployment of %s sent by the resumed run", contract)
+            continue
+        with PROFILER.span("deploy:" + contract):
+            tx_hash, nonce = NONCE_MANAGER.send(partial(build_deploy_transaction, abi, bytecode, name=contract),
+                                                OWNER_SIGNER)
+        tx_hashes[contract] = hex_hash(tx_hash)
+        PROFILER.track("deploy:" + contract, tx_hashes[contract], RECEIPT_TRACKER.watch(tx_hash))
+        JOURNAL.record_sent("deploy:" + contract, tx_hashes[contract], nonce, bytecodeHash=bytecode_hash(bytecode))
+        logger.debug("deployment of %s sent in transaction %s with nonce %s", contract, tx_hashes[contract], nonce)
+    receipts = wait_for_receipts(tx_hashes.values())
+    failed = []
+    for contract, tx_hash in tx_hashes.items():
+        JOURNAL.record_mined("deploy:" + contract, receipts[tx_hash])
+        GAS_STRATEGY.record(gas_key(contract, "constructor", compiled_contracts.get(contract).get('bin')),
+                            receipts[tx_hash])
+        address = receipts[tx_hash]['contractAddress']
+        # geth fills contractAddress even when the creation reverted or ran out of gas
+        if receipts[tx_hash]['status'] != 1 or address is None:
+            logger.error("deployment of %s failed in transaction %s", contract, tx_hash)
+            failed.append(contract)
+            continue
         contract_addresses[contract] = address
         logger.info('address for contract named %s is %s', str(contract), str(address))
+    GAS_STRATEGY.save()
+    if failed:
+        raise Exception("contract deployment failed for %s" % ", ".join(failed))
     return contract_addresses
 
 
+def save_contract_addresses(contract_addresses, compiled_contracts):
+    """
+    Writes addresses.txt and the topic index of the deployment.
+    """
+    deployment.save_contract_addresses(ARTIFACTS, contract_addresses, compiled_contracts)
+
+
 def move_files_to_backend():
-    # move to backend
-    os.system('rm -r ../../backend/backend/services/blockchain/contracts/')
-    os.system('mkdir -p ../../backend/backend/services/blockchain/contracts/')
-    os.system('cp -r ../build/abi/  ../../backend/backend/services/blockchain/contracts/')
-    os.system('cp -r ../build/contract_address  ../../backend/backend/services/blockchain/contracts/')
-    # move to event parser
-    os.system('mkdir -p ../../quorum-event-parser/contracts/')
-    os.system('cp -r ../build/abi/  ../../quorum-event-parser/contracts/')
-    os.system('cp -r ../build/contract_address  ../../quorum-event-parser/contracts/')
-
-
-def execute_contract_method(f, account):
-    logger.debug("START execute contract for function %s", str(f))
-    gas_estimate = f.estimateGas()
-    transaction = f.buildTransaction({
+    """
+    Copies the abi, contract_address, packed and index directories into the backend and the event parser,
+    see artifacts.py.
+    Only the files whose content changed are copied.
+    """
+    copied = ARTIFACTS.publish()
+    logger.info("%d artifact files published to %s", copied, ", ".join(ARTIFACTS.consumer_dirs))
+
+
+def build_method_transaction(f, nonce, key=None):
+    """
+    Builds the transaction calling a contract function, without signing or sending it.
+    Gas price and gas limit are chosen by GAS_STRATEGY.
+    :param f: the contract function, with its arguments
+    :param nonce: nonce of the owner account to use for the transaction
+    :param key: name of the function, such as "TDRManager.loadTdrStorage", used to look up its learned gas limit
+    :return: the transaction dictionary
+    """
+    return f.buildTransaction({
         'from': OWNER_ACCOUNT.address,
-        'gas': gas_estimate,
-        'gasPrice': w3.eth.gasPrice,
-        'nonce': w3.eth.getTransactionCount(OWNER_ACCOUNT.address)
+        'gas': GAS_STRATEGY.gas_limit(key, partial(f.estimateGas, {'from': OWNER_ACCOUNT.address})),
+        'gasPrice': GAS_STRATEGY.gas_price(),
+        'nonce': nonce
     })
 
-    # buildTransaction()({
-    #     'from': account.address,
-    #     'gas': gas_estimate,
-    #     'gasPrice': w3.eth.gasPrice,
-    #     'nonce': w3.eth.getTransactionCount(account.address)
-    # })
-    signed_transaction = OWNER_ACCOUNT.signTransaction(transaction)
-    tx_hash = w3.eth.sendRawTransaction(signed_transaction.rawTransaction)
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    if not tx_receipt.transactionHash.hex():
-        raise Exception("execution failed %s", str(f))
+
+def resolve_wiring(contract_address, changed=None):
+    """
+    Resolves the addresses of the WIRING edges.
+    :param contract_address: dictionary containing contract name as key mapped with their address
+    :param changed: if given, only the edges whose target or address is one of these contracts are returned
+    :return: list of (target contract, setter, address, message) tuples
+    """
+    return deployment.resolve_wiring(contract_address, MANAGER_ACCOUNT.address, changed)
+
+
+def execute_wiring(edges, contract_address, compiled_contracts):
+    """
+    Executes the setter transactions of the wiring edges.
+    All the transactions are signed with consecutive nonces from NONCE_MANAGER, sent back to back and their receipts
+    are waited for in a single pass. Every transaction is recorded in JOURNAL; edges found in RESUMED_STEPS with the
+    same target contract address and the same address set are not sent again.
+    :param edges: list of (target contract, setter, address, message) tuples, as returned by resolve_wiring
+    :param contract_address: dictionary containing contract name as key mapped with their address
+    :param compiled_contracts: dictionary of the compiled contracts, with their abi and bytecode
+    """
+    tx_hashes = []
+    # resumed steps whose receipt is already in the journal
+    journaled = set()
+    for target, setter, address, message in edges:
+        logger.debug("UPDATING: %s", message)
+        logger.debug("with address %s", address)
+        print("UPDATING: " + message)
+        print("with address " + str(address))
+        contract = w3.eth.contract(address=contract_address.get(target),
+                                   abi=compiled_contracts.get(target).get('abi'))
+        step = "wire:%s.%s" % (target, setter)
+        resumed = RESUMED_STEPS.get(step)
+        # a redeployed target has a new address and must be wired again even if the address it is set to is the same
+        if (resumed is not None and resumed.get("address") == address
+                and resumed.get("targetAddress") == contract_address.get(target)):
+            logger.info("%s already sent by the resumed run in transaction %s", step, resumed["txHash"])
+            tx_hashes.append(hex_hash(resumed["txHash"]))
+            if resumed["state"] == "mined":
+                journaled.add(step)
+            continue
+        func = getattr(contract.functions, setter)(address)
+        with PROFILER.span(step):
+            tx_hash, nonce = NONCE_MANAGER.send(partial(build_method_transaction, func, key=gas_key(target, setter)),
+                                                OWNER_SIGNER)
+        tx_hashes.append(hex_hash(tx_hash))
+        PROFILER.track(step, tx_hashes[-1], RECEIPT_TRACKER.watch(tx_hash))
+        JOURNAL.record_sent(step, tx_hashes[-1], nonce, address=address, targetAddress=contract_address.get(target))
+    receipts = wait_for_receipts(tx_hashes)
+    failed = []
+    for (target, setter, address, message), tx_hash in zip(edges, tx_hashes):
+        if "wire:%s.%s" % (target, setter) not in journaled:
+            JOURNAL.record_mined("wire:%s.%s" % (target, setter), receipts[tx_hash])
+        GAS_STRATEGY.record(gas_key(target, setter), receipts[tx_hash])
+        if receipts[tx_hash]['status'] != 1:
+            logger.error("wiring %s.%s(%s) reverted in transaction %s", target, setter, address, tx_hash)
+            failed.append("%s.%s(%s)" % (target, setter, address))
+    GAS_STRATEGY.save()
+    if failed:
+        raise Exception("wiring failed for " + ", ".join(failed))
+
+
+def send_planned_transactions(planned):
+    """
+    Signs and sends transactions whose nonce and gas are already set, back to back, and waits for all of them.
+    :param planned: list of (description, gas key, transaction) tuples, in nonce order
+    :return: list of the receipts, in the order of planned
+    """
+    tx_hashes = []
+    for description, key, transaction in planned:
+        with PROFILER.span(description):
+            signed_transaction = OWNER_SIGNER.signTransaction(transaction)
+            tx_hashes.append(hex_hash(w3.eth.sendRawTransaction(signed_transaction.rawTransaction)))
+        PROFILER.track(description, tx_hashes[-1], RECEIPT_TRACKER.watch(tx_hashes[-1]))
+        logger.debug("%s sent in transaction %s with nonce %s", description, tx_hashes[-1], transaction['nonce'])
+    receipts = wait_for_receipts(tx_hashes)
+    failed = []
+    for (description, key, transaction), tx_hash in zip(planned, tx_hashes):
+        GAS_STRATEGY.record(key, receipts[tx_hash])
+        if receipts[tx_hash]['status'] != 1:
+            logger.error("%s failed in transaction %s", description, tx_hash)
+            failed.append(description)
+    GAS_STRATEGY.save()
+    if failed:
+        raise Exception("transactions failed: " + ", ".join(failed))
+    return [receipts[tx_hash] for tx_hash in tx_hashes]
+
+
+def plan_transaction(planned, description, key, build_transaction):
+    """
+    Appends a transaction to a plan, with the next nonce and a gas limit that does not need estimation.
+    :param planned: list of (description, gas key, transaction) tuples
+    :param build_transaction: function taking the transaction parameters and returning the transaction
+    """
+    planned.append((description, key, build_transaction({
+        'from': OWNER_ACCOUNT.address,
+        'gas': GAS_STRATEGY.known_gas_limit(key),
+        'gasPrice': GAS_STRATEGY.gas_price(),
+        'chainId': CHAIN_ID,
+        'nonce': NONCE_MANAGER.next()
+    })))
+
+
+def deploy_create2(compiled_contracts, release_tag, multicall=False):
+    """
+    Deploys the contracts through the KdaFactory with CREATE2 and wires them, in a single pipeline.
+    The salt of each contract is derived from its name and release_tag, so every address is computed before
+    anything is sent. The deployments, the wiring transactions and the transfer of the ownership back to the owner
+    account are then all signed up front and sent back to back.
+    Contracts deployed by the factory are owned by the factory, so their setters are called through
+    KdaFactory.execute. Contracts already deployed at their CREATE2 address are kept. If one is still owned by the
+    factory, a previous run failed before transferring its ownership: all its setters and the transfer are planned
+    again through the factory. The others are wired directly, and only the edges which do not store the right
+    address yet are sent (see filter_wired_edges), so running --create2 again repairs a failed run.
+    With multicall, all the calls going through the factory are sent as a single KdaFactory.executeBatch
+    transaction, which either fully succeeds or changes nothing. The setters of contracts which are not owned by the
+    factory are still sent as separate transactions, outside of the batch.
+    :param compiled_contracts: dictionary of the compiled contracts, with their abi and bytecode
+    :param release_tag: tag of the release, part of the salt of every contract
+    :param multicall: wire the contracts deployed by the factory in a single transaction
+    :return: dictionary containing contract name as key mapped with their address, including the factory
+    """
+    contract_addresses = load_contract_addresses()
+    factory_abi = compiled_contracts.get(FACTORY).get('abi')
+    planned = []
+
+    factory_address = contract_addresses.get(FACTORY)
+    if factory_address is None or w3.eth.getCode(factory_address) in (None, b''):
+        factory_deployer = w3.eth.contract(abi=factory_abi, bytecode=compiled_contracts.get(FACTORY).get('bin'))
+        plan_transaction(planned, "deploy " + FACTORY,
+                         gas_key(FACTORY, "constructor", compiled_contracts.get(FACTORY).get('bin')),
+                         factory_deployer.constructor().buildTransaction)
+        # the factory is a plain deployment, its address follows from the nonce of its transaction
+        factory_address = create_address(OWNER_ACCOUNT.address, planned[-1][2]['nonce'])
+    contract_addresses[FACTORY] = factory_address
+    factory = w3.eth.contract(address=factory_address, abi=factory_abi)
+    logger.info("CREATE2 factory at %s, release tag %s", factory_address, release_tag)
+
+    contracts = [contract for contract in CONTRACTS if contract not in SKIPPED_CONTRACTS]
+    init_codes = {}
+    for contract in contracts:
+        constructor = w3.eth.contract(abi=compiled_contracts.get(contract).get('abi'),
+                                      bytecode=compiled_contracts.get(contract).get('bin')).constructor(
+            ADMIN_ACCOUNT.address, MANAGER_ACCOUNT.address)
+        init_codes[contract] = constructor.data_in_transaction
+        contract_addresses[contract] = create2_address(factory_address, contract_salt(contract, release_tag),
+                                                       init_codes[contract])
+        logger.info('address for contract named %s is %s', contract, contract_addresses[contract])
+    codes = batch_request(w3, [("eth_getCode", [contract_addresses[contract], "latest"]) for contract in contracts])
+    new_contracts = [contract for contract, code in zip(contracts, codes) if code in (None, "0x", "0x0")]
+    existing_contracts = [contract for contract in contracts if contract not in new_contracts]
+    owners = batch_request(w3, [("eth_call", [{
+        "to": contract_addresses[contract],
+        "data": w3.eth.contract(abi=compiled_contracts.get(contract).get('abi')).encodeABI(fn_name="getOwner")},
+        "latest"]) for contract in existing_contracts])
+    # contracts left owned by the factory by a previous run which failed before the transfer of their ownership
+    stranded_contracts = [contract for contract, owner in zip(existing_contracts, owners)
+                          if owner and len(owner) >= 42 and "0x" + owner[-40:].lower() == factory_address.lower()]
+    if stranded_contracts:
+        logger.warning("contracts still owned by the factory, wiring them again: %s", ", ".join(stranded_contracts))
+    # contracts whose setters go through the factory
+    factory_owned = new_contracts + stranded_contracts
+
+    for contract in new_contracts:
+        plan_transaction(planned, "deploy " + contract, gas_key(FACTORY, "deploy:" + contract, init_codes[contract]),
+                         factory.functions.deploy(contract_salt(contract, release_tag),
+                                                  init_codes[contract]).buildTransaction)
+    # calls made by the factory, as (description, target address, call data)
+    factory_calls = []
+    # setters of contracts which are not owned by the factory
+    direct_calls = 0
+    edges = resolve_wiring(contract_addresses)
+    edges = [edge for edge in edges if edge[0] in factory_owned] + filter_wired_edges(
+        [edge for edge in edges if edge[0] not in factory_owned], contract_addresses, compiled_contracts)
+    for target, setter, address, message in edges:
+        print("UPDATING: " + message)
+        target_contract = w3.eth.contract(address=contract_addresses.get(target),
+                                          abi=compiled_contracts.get(target).get('abi'))
+        if target in factory_owned:
+            factory_calls.append(("%s.%s(%s)" % (target, setter, address), contract_addresses.get(target),
+                                  target_contract.encodeABI(fn_name=setter, args=[address])))
+        else:
+            direct_calls += 1
+            plan_transaction(planned, "%s.%s(%s)" % (target, setter, address), gas_key(target, setter),
+                             getattr(target_contract.functions, setter)(address).buildTransaction)
+    for contract in factory_owned:
+        target_contract = w3.eth.contract(abi=compiled_contracts.get(contract).get('abi'))
+        factory_calls.append(("%s.setOwner(%s)" % (contract, OWNER_ACCOUNT.address), contract_addresses.get(contract),
+                              target_contract.encodeABI(fn_name="setOwner", args=[OWNER_ACCOUNT.address])))
+    if multicall and factory_calls:
+        if direct_calls:
+            logger.warning("%d setters of contracts not owned by the factory are sent outside of the batch, the "
+                           "wiring is not atomic", direct_calls)
+            print("%d setters of existing contracts are sent outside of the executeBatch transaction" % direct_calls)
+        # the gas of a batch depends on its calls, a limit is only reused for the same set of calls
+        calls = ",".join(sorted(description.split("(")[0] for description, _, _ in factory_calls))
+        plan_transaction(planned, "%s.executeBatch(%d calls)" % (FACTORY, len(factory_calls)),
+                         gas_key(FACTORY, "executeBatch", calls),
+                         factory.functions.executeBatch([target for _, target, _ in factory_calls],
+                                                        [data for _, _, data in factory_calls]).buildTransaction)
+    else:
+        for description, target, data in factory_calls:
+            plan_transaction(planned, description, gas_key(FACTORY, "execute:" + description.split("(")[0]),
+                             factory.functions.execute(target, data).buildTransaction)
+
+    print("sending %d transactions" % len(planned))
+    send_planned_transactions(planned)
+    return contract_addresses
 
 
-def set_contract_address(contract, _func, address, message):
-    func = getattr(contract.functions, _func)
-    logger.debug("UPDATING: %s", message)
-    logger.debug("with address %s", address)
-    print("UPDATING: " + message)
-    print("with address " + str(address))
-    execute_contract_method(func(address), OWNER_ACCOUNT)
-    # sleep(1)
+def wiring_getter(setter):
+    """
+    Returns the view function reading the address written by a setter of WIRING.
+    setManager is read with getManager, setTdrManager with tdrManager and loadXyz with xyzAddress.
+    """
+    if setter == "setManager":
+        return "getManager"
+    if setter.startswith("set"):
+        return setter[3].lower() + setter[4:]
+    if setter.startswith("load"):
+        return setter[4].lower() + setter[5:] + "Address"
+    raise ValueError("no getter known for setter %s" % setter)
 
 
-def instantiate(contract_address, compiled_contracts):
+def filter_wired_edges(edges, contract_address, compiled_contracts):
+    """
+    Drops the edges whose target contract already stores the right address.
+    The current value of every edge is read with a view call, all the calls are sent in a single batch.
+    :param edges: list of (target contract, setter, address, message) tuples, as returned by resolve_wiring
+    :return: the edges which still need a transaction
+    """
+    readable = [edge for edge in edges if contract_address.get(edge[0]) is not None]
+    calls = []
+    for target, setter, address, message in readable:
+        contract = w3.eth.contract(abi=compiled_contracts.get(target).get('abi'))
+        calls.append(("eth_call", [{"to": contract_address.get(target),
+                                    "data": contract.encodeABI(fn_name=wiring_getter(setter))}, "latest"]))
+    try:
+        results = batch_request(w3, calls)
+    except ValueError as e:
+        logger.warning("could not read the current wiring, sending every edge: %s", e)
+        return edges
+    wired = set()
+    for (target, setter, address, message), result in zip(readable, results):
+        if result and len(result) >= 42 and str(address).lower() == "0x" + result[-40:].lower():
+            logger.debug("%s.%s already set to %s", target, setter, address)
+            wired.add((target, setter))
+    return [edge for edge in edges if (edge[0], edge[1]) not in wired]
+
+
+def instantiate(contract_address, compiled_contracts, changed=None, skip_wired=False):
     """
     Managers of all the functions needs to be instantiated
     1. TDR manager manages TdrStorage
     2. TDR manager also needs user manager
-
+    The complete list of the setters to call is declared in WIRING.
+    :param changed: if given, only the edges touching these contracts are executed
+    :param skip_wired: read the current value of each edge first and only send the ones which differ
     """
-    # For user manager
-    tdr_storage_address = contract_address.get('TdrStorage')
-    user_manager_address = contract_address.get('UserManager')
-    tdr_manager_address = contract_address.get('TDRManager')
-    drc_storage_address = contract_address.get('DrcStorage')
-    drc_manager_address = contract_address.get('DRCManager')
-    dta_storage_address = contract_address.get('DrcTransferApplicationStorage')
-    dua_storage_address = contract_address.get('DuaStorage')
-    nominee_storage_address = contract_address.get('NomineeStorage')
-    nominee_manager_address = contract_address.get('NomineeManager')
-    duc_storage_address = contract_address.get('DucStorage')
-    user_storage_address = contract_address.get('UserStorage')
-
-    # load tdr manager abi
-    tdr_storage_contract = w3.eth.contract(address=tdr_storage_address,
-                                           abi=compiled_contracts.get('TdrStorage').get('abi'))
-    user_manager_contract = w3.eth.contract(address=user_manager_address,
-                                            abi=compiled_contracts.get('UserManager').get('abi'))
-    tdr_manager_contract = w3.eth.contract(address=tdr_manager_address,
-                                           abi=compiled_contracts.get('TDRManager').get('abi'))
-    drc_storage_contract = w3.eth.contract(address=drc_storage_address,
-                                           abi=compiled_contracts.get('DrcStorage').get('abi'))
-    drc_manager_contract = w3.eth.contract(address=drc_manager_address,
-                                           abi=compiled_contracts.get('DRCManager').get('abi'))
-    dta_storage_contract = w3.eth.contract(address=dta_storage_address,
-                                           abi=compiled_contracts.get('DrcTransferApplicationStorage').get('abi'))
-    dua_storage_contract = w3.eth.contract(address=dua_storage_address,
-                                           abi=compiled_contracts.get('DuaStorage').get('abi'))
-    nominee_storage_contract = w3.eth.contract(address=nominee_storage_address,
-                                               abi=compiled_contracts.get('NomineeStorage').get('abi'))
-    nominee_manager_contract = w3.eth.contract(address=nominee_manager_address,
-                                               abi=compiled_contracts.get('NomineeManager').get('abi'))
-    duc_storage_contract = w3.eth.contract(address=duc_storage_address,
-                                           abi=compiled_contracts.get('DucStorage').get('abi'))
-    user_storage_contract = w3.eth.contract(address=user_storage_address,
-                                           abi=compiled_contracts.get('UserStorage').get('abi'))
-    # # updating storage in tdr manager
-    # update_tdr_storage_method = tdr_manager_contract.functions.updateTdrStorage(tdr_storage_address)
-    # logger.debug("updating  tdr storage in tdr manager contract")
-    # execute_contract_method(update_tdr_storage_method, OWNER_ACCOUNT)
-
-    # updating user manager in tdr manager
-    set_contract_address(tdr_manager_contract, 'loadTdrStorage', tdr_storage_address,
-                         "updating tdr storage in tdr manager contract")
-
-    # # updating user manager in tdr manager
-    # update_user_manager_method = tdr_manager_contract.functions.updateUserManager(user_manager_address)
-    # logger.debug("updating user manager in tdr manager contract")
-    # execute_contract_method(update_user_manager_method, OWNER_ACCOUNT)
-
-    # updating user manager in tdr manager
-    set_contract_address(tdr_manager_contract, 'loadUserManager', user_manager_address,
-                         "updating user manager addres in tdr manager contract")
-    # # setting manager for tdrStorage
-    # update_tdr_storage_manager_method = tdr_storage_contract.functions.setManager(tdr_manager_address)
-    # print('updating manager in tdr storage contract')
-    # execute_contract_method(update_tdr_storage_manager_method, OWNER_ACCOUNT)
-
-    # setting manager for tdrStorage
-    set_contract_address(tdr_storage_contract, 'setManager', tdr_manager_address,
-                         "updating manager in tdr manager contract")
-
-    # # setting manager for userManager
-    # set_user_manager_method = user_manager_contract.functions.setManager(MANAGER_ACCOUNT.address)
-    # print('updating manager in user manager contract')
-    # execute_contract_method(set_user_manager_method, OWNER_ACCOUNT)
-    # print("updated manager to ", MANAGER_ACCOUNT.address)
-
-    # setting manager for userManager
-    set_contract_address(user_manager_contract, 'setManager', MANAGER_ACCOUNT.address,
-                         "updating manager in user manager contract")
-
-    # # updating drc storage in tdr manager
-    # update_drc_storage_method = tdr_manager_contract.functions.updateDrcStorage(drc_storage_address)
-    # logger.debug("updating  drc storage in tdr manager contract")
-    # execute_contract_method(update_drc_storage_method, OWNER_ACCOUNT)
-
-    # updating drc storage in tdr manager
-    set_contract_address(tdr_manager_contract, 'loadDrcStorage', drc_storage_address,
-                         "update drc storage in drc manager")
-
-    # updating drc storage in drc manager
-    set_contract_address(drc_manager_contract, 'loadDrcStorage', drc_storage_address,
-                         "update drc storage in drc manager")
-
-    # updating user manager in drc manager
-    set_contract_address(drc_manager_contract, 'loadUserManager', user_manager_address,
-                         "update user manager in drc manager")
-    # updating drc manager address in dta storage
-    set_contract_address(dta_storage_contract, 'setManager', drc_manager_address,
-                         "update drc manager in dta storage")
-    # updating drc manager address in dua storage
-    set_contract_address(dua_storage_contract, 'setManager', drc_manager_address,
-                         "update user manager in dua manager")
-    # updating dta storage in drc manager
-    set_contract_address(drc_manager_contract, 'loadDtaStorage', dta_storage_address,
-                         "update dta storage in drc manager")
-    # updating dua storage in drc manager
-    set_contract_address(drc_manager_contract, 'loadDuaStorage', dua_storage_address,
-                         "update dua storage in drc manager")
-
-    set_contract_address(duc_storage_contract, 'setManager', drc_manager_address,
-                         "update drc manager in duc storage")
-    # updating duc storage in drc manager
-    set_contract_address(drc_manager_contract, 'loadDucStorage', duc_storage_address,
-                         "update duc storage in drc manager")
-
-    set_contract_address(drc_storage_contract, 'setTdrManager', tdr_manager_address,
-                         "update tdr manager in drc storage")
-    set_contract_address(drc_storage_contract, 'setManager', drc_manager_address, "update drc manager in drc storage")
-    set_contract_address(drc_manager_contract, 'loadNomineeManager', nominee_manager_address,
-                         "update nominee manager in drc manager")
-    set_contract_address(nominee_manager_contract, 'loadNomineeStorage', nominee_storage_address,
-                         "update nominee storage in nominee manager")
-    set_contract_address(nominee_manager_contract, 'loadUserManager', user_manager_address,
-                         "update user manager in nominee manager")
-    set_contract_address(nominee_storage_contract, 'setManager', nominee_manager_address,
-                         "update nominee manager in nominee storage")
-    set_contract_address(user_storage_contract, 'setManager', user_manager_address,
-                         "update user manager in user storage")
-    set_contract_address(user_manager_contract, 'loadUserStorage', user_storage_address,
-                         "update user storage in user manager")
+    edges = resolve_wiring(contract_address, changed)
+    if skip_wired:
+        edges = filter_wired_edges(edges, contract_address, compiled_contracts)
+    if not edges:
+        print("nothing to instantiate")
+        return
+    execute_wiring(edges, contract_address, compiled_contracts)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compile and deploy the KDA-TDR contracts")
+    parser.add_argument("--parallel-compile", action="store_true",
+                        help="compile independent units of the import graph in a process pool")
+    parser.add_argument("--diff", action="store_true",
+                        help="only deploy the contracts whose bytecode changed since the last deployment")
+    parser.add_argument("--skip-wired", action="store_true",
+                        help="do not send the setters whose target already stores the right address")
+    parser.add_argument("--create2", action="store_true",
+                        help="deploy through the KdaFactory with CREATE2 and addresses computed up front")
+    parser.add_argument("--release-tag", default=config.get("releaseTag", "v1"),
+                        help="release tag used in the CREATE2 salts")
+    parser.add_argument("--multicall", action="store_true",
+                        help="with --create2, wire the new contracts in a single KdaFactory.executeBatch "
+                             "transaction; setters of contracts which already existed are still sent separately")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the previous run from its journal instead of starting over, not with --create2")
+    parser.add_argument("--profile", action="store_true",
+                        help="record the time of every phase, transaction and rpc call and write a trace")
+    return parser.parse_args()
+
+
 def main():
     """
     The main function
     :return:
     """
+    args = parse_args()
+    PROFILER.enabled = args.profile
     # os.system('rm logs.log')
     start_time = st = datetime.datetime.now()
     print("Compiling contracts")
-    compiled_contracts = get_compiled_contracts()
+    with PROFILER.span("compile", "phase"):
+        compiled_contracts = get_compiled_contracts(parallel=args.parallel_compile)
     print("Contracts compiled")
     print("Deploying contract")
     # f=open('../build/contract_address/addresses.txt')
     # contract_addresses = json.loads(f.read())
-    contract_addresses = deploy_all_contracts(compiled_contracts)
+    changed = None
+    if args.multicall and not args.create2:
+        # the batch executor can only call the setters of the contracts it owns, i.e. the ones it deployed
+        print("--multicall requires --create2")
+        exit(1)
+    if args.resume and args.create2:
+        # the create2 pipeline is not journaled, a new --create2 run keeps the contracts already at their address
+        print("--resume cannot be used with --create2, run --create2 again instead")
+        exit(1)
+    if args.resume:
+        RESUMED_STEPS.update(JOURNAL.recover(w3))
+        print("resuming %d steps from %s" % (len(RESUMED_STEPS), JOURNAL.path))
+    else:
+        JOURNAL.reset()
+    with PROFILER.span("deploy", "phase"):
+        if args.create2:
+            # deployments and wiring go out in the same pipeline
+            contract_addresses = deploy_create2(compiled_contracts, args.release_tag, multicall=args.multicall)
+        else:
+            if args.diff:
+                changed = find_changed_contracts(compiled_contracts, load_contract_addresses())
+                print("contracts to deploy: ", changed)
+            contract_addresses = deploy_all_contracts(compiled_contracts, changed)
     print("Contracts deployed")
     logger.info(contract_addresses)
     print(json.dumps(contract_addresses))
-    f = open('../build/contract_address/addresses.txt', 'w')
-    f.write(json.dumps(contract_addresses))
-    f.close()
-    move_files_to_backend()
+    with PROFILER.span("write artifacts", "phase"):
+        save_contract_addresses(contract_addresses, compiled_contracts)
+        save_bytecode_hashes([contract for contract in (changed if changed is not None else CONTRACTS)
+                              if contract not in SKIPPED_CONTRACTS], compiled_contracts)
+        move_files_to_backend()
+    if not args.create2:
+        print("instantiating")
+        with PROFILER.span("instantiate", "phase"):
+            instantiate(contract_addresses, compiled_contracts, changed, skip_wired=args.skip_wired)
+    # taken after instantiate, the wiring is part of the deployment
     end_time = datetime.datetime.now()
-    print("instantiating")
-    instantiate(contract_addresses, compiled_contracts)
     print("total execution time: ", end_time - start_time)
+    if args.profile:
+        print(PROFILER.summary())
+        print("trace written to " + PROFILER.write_trace())
     b = w3.eth.blockNumber
     # run_all_test()
     print("last mined block after instantiation was ", w3.eth.blockNumber)
@@ -0,0 +1,234 @@
+"""
+Contracts, wiring graph, compilation and deployment records shared by the entry points of the deployer.
+
+deployer.py, async_deployer.py and bundle.py deploy the same contracts and read and write the same artifacts. This
+module holds what they share without any side effect at import time: it does not read config.json, connect to the
+node or install solc, so every entry point only sets up what it uses.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from time import perf_counter
+
+import solcx
+
+import compiler
+from artifacts import ABI_DIR, BYTECODE_DIR, ADDRESSES_FILE, BYTECODE_HASHES_FILE
+
+logger = logging.getLogger()
+
+FILES_TO_COMPILE = [
+    "../contracts/DataTypes.sol",
+    "../contracts/TDR.sol",
+    "../contracts/DRC.sol",
+    "../contracts/Application.sol",
+    "../contracts/DRCManager.sol",
+    "../contracts/TDRManager.sol",
+    "../contracts/UserManager.sol",
+    "../contracts/UtilizationApplication.sol",
+    "../contracts/nomineeStorage.sol",
+    "../contracts/nomineeManager.sol",
+    "../contracts/DucStorage.sol",
+    "../contracts/UserStorage.sol",
+    "../contracts/KdaFactory.sol"
+]
+CONTRACTS = ["DrcTransferApplicationStorage", "DrcStorage", "DRCManager", "TdrStorage", "TDRManager", "UserManager",
+             "DuaStorage", "NomineeStorage", "NomineeManager", "DucStorage", "UserStorage"]
+# SKIPPED_CONTRACTS = ["UserManager","TdrStorage","DrcStorage","NomineeStorage"]
+# SKIPPED_CONTRACTS = ["UserStorage", "TdrStorage", "NomineeStorage"]
+# SKIPPED_CONTRACTS = [
+#                     "DrcTransferApplicationStorage",
+#                      "DrcStorage",
+#                      # "DRCManager",
+#                      "TdrStorage",
+#                      "TDRManager",
+#                      "UserManager",
+#                      "DuaStorage",
+#                      "NomineeStorage",
+#                      "NomineeManager",
+#                      "UserStorage",
+#                      ]
+SKIPPED_CONTRACTS = []
+# The address of the manager account, instead of a contract, is set in the target
+MANAGER = "MANAGER_ACCOUNT"
+# Setters called by instantiate() once the contracts are deployed,
+# as (target contract, setter function, contract whose address is set, message)
+WIRING = [
+    ("TDRManager", "loadTdrStorage", "TdrStorage", "updating tdr storage in tdr manager contract"),
+    ("TDRManager", "loadUserManager", "UserManager", "updating user manager addres in tdr manager contract"),
+    ("TdrStorage", "setManager", "TDRManager", "updating manager in tdr manager contract"),
+    ("UserManager", "setManager", MANAGER, "updating manager in user manager contract"),
+    ("TDRManager", "loadDrcStorage", "DrcStorage", "update drc storage in drc manager"),
+    ("DRCManager", "loadDrcStorage", "DrcStorage", "update drc storage in drc manager"),
+    ("DRCManager", "loadUserManager", "UserManager", "update user manager in drc manager"),
+    ("DrcTransferApplicationStorage", "setManager", "DRCManager", "update drc manager in dta storage"),
+    ("DuaStorage", "setManager", "DRCManager", "update user manager in dua manager"),
+    ("DRCManager", "loadDtaStorage", "DrcTransferApplicationStorage", "update dta storage in drc manager"),
+    ("DRCManager", "loadDuaStorage", "DuaStorage", "update dua storage in drc manager"),
+    ("DucStorage", "setManager", "DRCManager", "update drc manager in duc storage"),
+    ("DRCManager", "loadDucStorage", "DucStorage", "update duc storage in drc manager"),
+    ("DrcStorage", "setTdrManager", "TDRManager", "update tdr manager in drc storage"),
+    ("DrcStorage", "setManager", "DRCManager", "update drc manager in drc storage"),
+    ("DRCManager", "loadNomineeManager", "NomineeManager", "update nominee manager in drc manager"),
+    ("NomineeManager", "loadNomineeStorage", "NomineeStorage", "update nominee storage in nominee manager"),
+    ("NomineeManager", "loadUserManager", "UserManager", "update user manager in nominee manager"),
+    ("NomineeStorage", "setManager", "NomineeManager", "update nominee manager in nominee storage"),
+    ("UserStorage", "setManager", "UserManager", "update user manager in user storage"),
+    ("UserManager", "loadUserStorage", "UserStorage", "update user storage in user manager"),
+]
+OUTPUT_VALUES = ["abi", "bin"]
+
+
+def install_solc(solc_version):
+    logger.debug("setting solc version to %s", solc_version)
+    solcx.install_solc(solc_version)
+    solcx.set_solc_version(solc_version)
+
+
+def compile_contracts(solc_version, artifacts, profiler, parallel=False):
+    """
+    This function returns a dictionary of all the compiled contracts, their ABI and bytecode.
+    It uses the solcx library to compile the contracts specified in the FILES_TO_COMPILE variable.
+    Files whose source, imports, solc version and output selection are unchanged since the last compilation are not
+    compiled again, their ABI and bytecode are loaded from ../build instead (see compiler.py).
+    The returned dictionary has the
+    contract name as the key and a dictionary containing the ABI and bytecode as the value.
+    Additionally, it saves the newly compiled contracts to the local storage using the save_contract function, and
+    packs all of them in a single bundle (see packed_artifacts.py). The topic and selector index (see topic_index.py)
+    is written with the addresses of the last deployment, and written again once the contracts are deployed.
+    :param solc_version: version of solc, installed with install_solc
+    :param artifacts: ArtifactPublisher writing the build outputs
+    :param profiler: Profiler recording the compilation
+    :param parallel: compile the import graph unit by unit in a process pool instead of a single solc invocation
+    :return: A dictionary with contract name as the key and a dictionary containing the ABI and bytecode as the value.
+    """
+    graph = compiler.build_import_graph(FILES_TO_COMPILE)
+    keys = compiler.cache_keys(graph, solc_version, OUTPUT_VALUES)
+    manifest = compiler.load_manifest()
+    compiled_contracts, stale_files = compiler.split_cached(graph, manifest, keys)
+    if not stale_files:
+        print("All contracts are up to date, using the cached build")
+        logger.info("compile cache hit for all the files")
+        artifacts.write_packed(compiled_contracts)
+        artifacts.write_index(compiled_contracts, load_contract_addresses())
+        return compiled_contracts
+    logger.info("following files changed and would be recompiled")
+    logger.info(stale_files)
+    compile_start = perf_counter()
+    with profiler.span("solc", "step", files=len(stale_files), parallel=parallel):
+        if parallel:
+            _compiled_contracts = compiler.compile_parallel(stale_files, graph, solc_version, OUTPUT_VALUES)
+        else:
+            _compiled_contracts = solcx.compile_files(stale_files,
+                                                      output_values=OUTPUT_VALUES)
+    compile_time = perf_counter() - compile_start
+    print("compiled %d files in %.2fs (%s)" % (len(stale_files), compile_time, "parallel" if parallel else "serial"))
+    logger.info("compiled %d files in %.2fs, parallel: %s", len(stale_files), compile_time, parallel)
+    # Formatting dictionary
+    with profiler.span("save compiled artifacts", "step", contracts=len(_compiled_contracts)):
+        for key in _compiled_contracts.keys():
+            value = _compiled_contracts.get(key)
+            print(key)
+            new_key = key.split(":")[1]
+            compiled_contracts[new_key] = value
+            save_contract(artifacts, new_key, value)
+        compiler.update_manifest(manifest, stale_files, keys, _compiled_contracts)
+        compiler.save_manifest(manifest)
+        artifacts.write_packed(compiled_contracts)
+        artifacts.write_index(compiled_contracts, load_contract_addresses())
+    return compiled_contracts
+
+
+def save_contract(artifacts, key, value):
+    """
+    This function saves the ABI and bytecode of a contract to the local storage.
+    The ABI is saved in a file named "{key}.abi" in the "../build/abi/" directory,
+    and the bytecode is saved in a file named "{key}.bin" in the "../build/bytecode/" directory.
+    :param key: The name of the contract
+    :param value: A dictionary containing the ABI and bytecode of the contract
+    """
+    # logger.debug(type(value.get('abi')))
+    # logger.debug(json.dumps(value.get('abi')))
+    artifacts.write(os.path.join(ABI_DIR, key + ".abi"), json.dumps(value.get('abi')))
+    artifacts.write(os.path.join(BYTECODE_DIR, key + ".bin"), value.get('bin'))
+
+
+def gas_key(contract, function, bytecode=None):
+    """
+    Returns the key of a function in the learned gas limits of the GasStrategy, such as "TDRManager.loadTdrStorage".
+    The key of a deployment includes the sha256 of the deployed bytecode, so the gas limit learned for a previous
+    version of a contract is not reused once its bytecode changes. The key of a KdaFactory.executeBatch includes the
+    sha256 of its calls, passed as bytecode, so the limit learned for one batch is not used for a larger one.
+    """
+    if contract is None:
+        return None
+    if bytecode is not None:
+        return "%s.%s@%s" % (contract, function, bytecode_hash(bytecode))
+    return contract + "." + function
+
+
+def load_contract_addresses():
+    """
+    Returns the addresses of the previous deployment, saved in addresses.txt
+    """
+    if os.path.isfile(ADDRESSES_FILE):
+        f = open(ADDRESSES_FILE, 'r')
+        contract_addresses = json.loads(f.read())
+        f.close()
+    else:
+        os.makedirs(os.path.dirname(ADDRESSES_FILE), exist_ok=True)
+        contract_addresses = {}
+    return contract_addresses
+
+
+def bytecode_hash(bytecode):
+    return hashlib.sha256(bytecode.encode()).hexdigest()
+
+
+def load_bytecode_hashes():
+    if not os.path.isfile(BYTECODE_HASHES_FILE):
+        return {}
+    with open(BYTECODE_HASHES_FILE, 'r') as f:
+        return json.loads(f.read())
+
+
+def save_bytecode_hashes(artifacts, contracts, compiled_contracts):
+    """
+    Records the hash of the bytecode deployed for each contract, next to addresses.txt
+    :param contracts: names of the contracts deployed by this run
+    :param compiled_contracts: dictionary of the compiled contracts, with their abi and bytecode
+    """
+    hashes = load_bytecode_hashes()
+    for contract in contracts:
+        hashes[contract] = bytecode_hash(compiled_contracts.get(contract).get('bin'))
+    artifacts.write(BYTECODE_HASHES_FILE, json.dumps(hashes))
+
+
+def save_contract_addresses(artifacts, contract_addresses, compiled_contracts):
+    """
+    Writes addresses.txt and the topic index of the deployment.
+    """
+    artifacts.write(ADDRESSES_FILE, json.dumps(contract_addresses))
+    artifacts.write_index(compiled_contracts, contract_addresses)
+
+
+def resolve_wiring(contract_address, manager_address, changed=None):
+    """
+    Resolves the addresses of the WIRING edges.
+    :param contract_address: dictionary containing contract name as key mapped with their address
+    :param manager_address: address of the manager account, set where WIRING names MANAGER
+    :param changed: if given, only the edges whose target or address is one of these contracts are returned
+    :return: list of (target contract, setter, address, message) tuples
+    """
+    edges = []
+    for target, setter, source, message in WIRING:
+        if changed is not None and target not in changed and source not in changed:
+            continue
+        if source == MANAGER:
+            address = manager_address
+        else:
+            address = contract_address.get(source)
+        edges.append((target, setter, address, message))
+    return edges
@@ -0,0 +1,108 @@
+"""
+Gas price and gas limit selection for the deployer.
+
+Calling gasPrice and estimateGas for every transaction costs two extra round trips per transaction, although our
+quorum network runs with a zero gas price and the setters always cost the same. GasStrategy caches the gas price
+for a few seconds and remembers the gas used by every function in ../build/gas/gas_limits.json, so estimateGas only
+runs for functions it has never seen.
+
+Modes:
+    estimate: always call estimateGas, the behaviour of the original deployer
+    learned: use the gas limit learned from previous receipts, estimate only unknown functions
+    fixed: never estimate, use the learned gas limit or the default gas limit
+"""
+
+import json
+import os
+import threading
+import time
+
+GAS_LIMITS_FILE = "../build/gas/gas_limits.json"
+MODES = ("estimate", "learned", "fixed")
+
+
+class GasStrategy:
+
+    def __init__(self, w3, mode="learned", price_ttl=60, default_gas_limit=8000000, margin=1.2,
+                 table_file=GAS_LIMITS_FILE):
+        """
+        :param w3: web3 instance connected to the node
+        :param mode: one of MODES
+        :param price_ttl: seconds for which the gas price read from the node is reused
+        :param default_gas_limit: gas limit used in fixed mode for functions without a learned limit
+        :param margin: factor applied to the gas used by a receipt to get the learned gas limit
+        :param table_file: file in which the learned gas limits are saved
+        """
+        if mode not in MODES:
+            raise ValueError("unknown gas strategy %s, expected one of %s" % (mode, ", ".join(MODES)))
+        self.w3 = w3
+        self.mode = mode
+        self.price_ttl = price_ttl
+        self.default_gas_limit = default_gas_limit
+        self.margin = margin
+        self.table_file = table_file
+        self._lock = threading.Lock()
+        self._gas_price = None
+        self._gas_price_time = 0
+        self.gas_limits = {}
+        if os.path.isfile(table_file):
+            with open(table_file, 'r') as f:
+                self.gas_limits = json.load(f)
+
+    def gas_price(self):
+        """
+        Returns the gas price of the node, read at most once every price_ttl seconds.
+        """
+        with self._lock:
+            if self._gas_price is None or time.monotonic() - self._gas_price_time > self.price_ttl:
+                self._gas_price = self.w3.eth.gasPrice
+                self._gas_price_time = time.monotonic()
+            return self._gas_price
+
+    def gas_limit(self, key, estimate):
+        """
+        Returns the gas limit of a transaction.
+        :param key: name of the function, such as "TDRManager.loadTdrStorage", or of a deployment, such as
+                    "TDRManager.constructor@<sha256 of the bytecode>"
+        :param estimate: function returning the gas estimate of the transaction, called only when needed
+        :return: the gas limit to use
+        """
+        if self.mode == "estimate" or key is None:
+            return estimate()
+        if key in self.gas_limits:
+            return self.gas_limits[key]
+        if self.mode == "fixed":
+            return self.default_gas_limit
+        return estimate()
+
+    def known_gas_limit(self, key):
+        """
+        Returns the gas limit of a transaction which cannot be estimated, for example because it depends on
+        transactions which are not mined yet: the learned gas limit, or the default gas limit.
+        """
+        return self.gas_limits.get(key, self.default_gas_limit)
+
+    def record(self, key, receipt):
+        """
+        Learns the gas limit of a function from the receipt of a successful transaction. The largest limit learned so
+        far is kept: the same setter costs far less when it overwrites a nonzero slot, as a --diff rewire does, than
+        when it writes a slot for the first time, so the last receipt alone is not enough for the next full deploy.
+        The learned limit is only forgotten when a failed transaction used all of it, as it then ran out of gas, so
+        the next one is estimated.
+        """
+        if key is None:
+            return
+        with self._lock:
+            learned = self.gas_limits.get(key)
+            if receipt.get('status') != 1:
+                if learned is not None and receipt['gasUsed'] >= learned:
+                    del self.gas_limits[key]
+                return
+            self.gas_limits[key] = max(learned or 0, int(receipt['gasUsed'] * self.margin))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.table_file), exist_ok=True)
+        with self._lock:
+            with open(self.table_file + '.tmp', 'w') as f:
+                json.dump(self.gas_limits, f, indent=2, sort_keys=True)
+            os.replace(self.table_file + '.tmp', self.table_file)
@@ -0,0 +1,329 @@
+"""
+Event indexer for the deployed contracts.
+
+Reads addresses.txt and the compiled ABIs, pulls the logs of every deployed contract with eth_getLogs and decodes
+them into a SQLite database, ../build/index/events.db by default:
+
+    events(block_number, log_index, tx_hash, contract, address, event, application_id, drc_id, args)
+    applicants(applicant, field, block_number, log_index)    one row per element of a bytes32[] argument,
+                                                             such as applicants, buyers or owners
+
+events is indexed on application_id and drc_id and applicants on applicant, so the history of an application, a
+DRC or a user is read without going back to the chain.
+
+The backfill splits the block range into chunks and keeps several of them in flight at once. The chunk size adapts:
+it doubles after a chunk with few logs and a chunk the node refuses (too many results, timeout) is split in two and
+retried. Once the backfill reaches the head of the chain the indexer keeps following new blocks, unless --no-follow
+is given. The last indexed block is kept in the database, so an interrupted run continues where it stopped.
+
+Usage:
+    python3 indexer.py [--from-block N] [--concurrency 4] [--no-follow] [--db FILE] [--node http://host:port]
+    python3 indexer.py --application-id 0x... | --drc-id 0x... | --applicant 0x...
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from time import sleep
+
+from eth_abi import decode_abi
+from web3 import Web3
+
+from artifacts import ABI_DIR, ADDRESSES_FILE
+from batch_provider import BatchHTTPProvider
+from packed_artifacts import canonical_type
+from topic_index import build_index, match_log
+
+DB_FILE = "../build/index/events.db"
+# argument names stored in their own columns
+APPLICATION_ID_FIELD = "applicationId"
+DRC_ID_FIELD = "drcId"
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    contract TEXT NOT NULL,
+    address TEXT NOT NULL,
+    event TEXT NOT NULL,
+    application_id TEXT,
+    drc_id TEXT,
+    args TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_application_id ON events (application_id);
+CREATE INDEX IF NOT EXISTS events_drc_id ON events (drc_id);
+CREATE INDEX IF NOT EXISTS events_event ON events (event);
+CREATE TABLE IF NOT EXISTS applicants (
+    applicant TEXT NOT NULL,
+    field TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    PRIMARY KEY (applicant, field, block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS applicants_event ON applicants (block_number, log_index);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def load_deployment(abi_dir=ABI_DIR, addresses_file=ADDRESSES_FILE):
+    """
+    :return: tuple (compiled contracts with their abi, contract addresses) of the deployed contracts
+    """
+    with open(addresses_file, 'r') as f:
+        contract_addresses = json.loads(f.read())
+    compiled_contracts = {}
+    for contract in contract_addresses:
+        abi_file = os.path.join(abi_dir, contract + ".abi")
+        if os.path.isfile(abi_file):
+            with open(abi_file, 'r') as f:
+                compiled_contracts[contract] = {'abi': json.load(f)}
+    return compiled_contracts, contract_addresses
+
+
+def to_json_value(value):
+    """
+    Converts a value decoded by eth_abi into a json serializable value, bytes become hex strings.
+    """
+    if isinstance(value, bytes):
+        return "0x" + value.hex()
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+    return value
+
+
+def decode_log(entry, log):
+    """
+    Decodes the arguments of a log.
+    :param entry: entry of the topic index matching the log
+    :return: dictionary with the argument name as key and its json value as value
+    """
+    inputs = entry["abi"].get("inputs", [])
+    indexed = [parameter for parameter in inputs if parameter.get("indexed")]
+    not_indexed = [parameter for parameter in inputs if not parameter.get("indexed")]
+    values = decode_abi([canonical_type(parameter) for parameter in not_indexed],
+                        bytes.fromhex(log["data"][2:]))
+    args = {parameter["name"]: to_json_value(value) for parameter, value in zip(not_indexed, values)}
+    for parameter, topic in zip(indexed, log["topics"][1:]):
+        abi_type = canonical_type(parameter)
+        if abi_type in ("string", "bytes") or abi_type.endswith("]") or abi_type.startswith("("):
+            # only the hash of a dynamic indexed argument is logged
+            args[parameter["name"]] = topic
+        else:
+            args[parameter["name"]] = to_json_value(decode_abi([abi_type], bytes.fromhex(topic[2:]))[0])
+    return args
+
+
+class EventIndexer:
+
+    def __init__(self, w3, compiled_contracts, contract_addresses, db_file=DB_FILE, concurrency=4,
+                 initial_chunk=1000, max_chunk=50000, target_logs=2000):
+        """
+        :param w3: web3 instance connected to the node
+        :param concurrency: number of eth_getLogs requests in flight
+        :param initial_chunk: number of blocks of the first requests
+        :param max_chunk: largest number of blocks requested at once
+        :param target_logs: the chunk size grows while the requests return fewer logs than this
+        """
+        self.w3 = w3
+        self.index = build_index(compiled_contracts, contract_addresses)
+        self.addresses = [address for contract, address in contract_addresses.items()
+                          if contract in compiled_contracts]
+        if not self.addresses:
+            # eth_getLogs without an address returns the logs of every contract
+            raise ValueError("no deployed contract with a known ABI to index")
+        self.concurrency = concurrency
+        self.chunk = initial_chunk
+        self.max_chunk = max_chunk
+        self.target_logs = target_logs
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        self.db = sqlite3.connect(db_file)
+        self.db.executescript(SCHEMA)
+
+    def last_block(self):
+        row = self.db.execute("SELECT value FROM state WHERE key = 'last_block'").fetchone()
+        return None if row is None else int(row[0])
+
+    def _set_last_block(self, block):
+        self.db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('last_block', ?)", (str(block),))
+
+    def get_logs(self, from_block, to_block):
+        """
+        Reads the logs of the deployed contracts in a block range.
+        :raise ValueError: if the node refuses the request
+        """
+        response = self.w3.provider.make_request("eth_getLogs", [{
+            "fromBlock": hex(from_block), "toBlock": hex(to_block), "address": self.addresses}])
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response["result"]
+
+    def _adapt(self, blocks, logs):
+        with self._lock:
+            if logs is None:
+                self.chunk = max(1, blocks // 2)
+            elif logs < self.target_logs // 2 and blocks >= self.chunk:
+                self.chunk = min(self.max_chunk, self.chunk * 2)
+
+    def store(self, logs):
+        """
+        Decodes and inserts logs, logs which do not belong to a known event are skipped.
+        :return: number of events stored
+        """
+        stored = 0
+        for log in logs:
+            entry = match_log(self.index, log)
+            if entry is None or log.get("removed"):
+                continue
+            args = decode_log(entry, log)
+            block_number, log_index = int(log["blockNumber"], 16), int(log["logIndex"], 16)
+            self.db.execute("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                block_number, log_index, log["transactionHash"], entry["contract"], log["address"],
+                entry["abi"]["name"], args.get(APPLICATION_ID_FIELD), args.get(DRC_ID_FIELD), json.dumps(args)))
+            for parameter in entry["abi"].get("inputs", []):
+                if canonical_type(parameter) == "bytes32[]" and isinstance(args.get(parameter["name"]), list):
+                    self.db.executemany("INSERT OR IGNORE INTO applicants VALUES (?, ?, ?, ?)", [
+                        (applicant, parameter["name"], block_number, log_index)
+                        for applicant in args[parameter["name"]]])
+            stored += 1
+        return stored
+
+    def backfill(self, from_block, to_block):
+        """
+        Indexes the logs of a block range, with up to concurrency eth_getLogs requests in flight.
+        The last indexed block only advances over ranges without a gap, so it is safe to stop at any time.
+        """
+        if from_block > to_block:
+            return
+        next_block = from_block
+        # ranges fetched but not yet covered by the last indexed block, as from block -> to block
+        done = {}
+        watermark = from_block - 1
+        total = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = {}
+            retries = []
+
+            def submit(start, end):
+                in_flight[executor.submit(self.get_logs, start, end)] = (start, end)
+
+            while in_flight or retries or next_block <= to_block:
+                while len(in_flight) < self.concurrency and (retries or next_block <= to_block):
+                    if retries:
+                        submit(*retries.pop())
+                    else:
+                        end = min(to_block, next_block + self.chunk - 1)
+                        submit(next_block, end)
+                        next_block = end + 1
+                finished, _ = wait_futures(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    start, end = in_flight.pop(future)
+                    try:
+                        logs = future.result()
+                    except (ValueError, IOError) as e:
+                        if start == end:
+                            raise
+                        logger.debug("eth_getLogs %s-%s failed (%s), splitting it", start, end, e)
+                        self._adapt(end - start + 1, None)
+                        middle = (start + end) // 2
+                        retries.extend([(middle + 1, end), (start, middle)])
+                        continue
+                    self._adapt(end - start + 1, len(logs))
+                    total += self.store(logs)
+                    done[start] = end
+                    while watermark + 1 in done:
+                        watermark = done.pop(watermark + 1)
+                    self._set_last_block(watermark)
+                    self.db.commit()
+        logger.info("indexed %d events from blocks %d to %d", total, from_block, to_block)
+
+    def run(self, from_block=0, follow=True, poll_interval=2, confirmations=0):
+        """
+        Backfills from the last indexed block (or from_block) to the head of the chain, then follows new blocks.
+        :param confirmations: number of blocks a log must be buried under before being indexed
+        """
+        last_block = self.last_block()
+        start = from_block if last_block is None else last_block + 1
+        while True:
+            head = self.w3.eth.blockNumber - confirmations
+            if head >= start:
+                self.backfill(start, head)
+                start = head + 1
+            if not follow:
+                return
+            sleep(poll_interval)
+
+    def close(self):
+        self.db.close()
+
+
+def query(db_file, application_id=None, drc_id=None, applicant=None):
+    """
+    Returns the events of an application, a DRC or an applicant, in chain order.
+    """
+    db = sqlite3.connect(db_file)
+    columns = "e.block_number, e.log_index, e.tx_hash, e.contract, e.event, e.args"
+    if applicant is not None:
+        rows = db.execute("SELECT DISTINCT " + columns + " FROM applicants a JOIN events e "
+                          "ON e.block_number = a.block_number AND e.log_index = a.log_index "
+                          "WHERE a.applicant = ? ORDER BY e.block_number, e.log_index", (applicant.lower(),))
+    elif application_id is not None:
+        rows = db.execute("SELECT " + columns + " FROM events e WHERE e.application_id = ? "
+                          "ORDER BY e.block_number, e.log_index", (application_id.lower(),))
+    else:
+        rows = db.execute("SELECT " + columns + " FROM events e WHERE e.drc_id = ? "
+                          "ORDER BY e.block_number, e.log_index", (drc_id.lower(),))
+    events = [{"blockNumber": row[0], "logIndex": row[1], "transactionHash": row[2], "contract": row[3],
+               "event": row[4], "args": json.loads(row[5])} for row in rows]
+    db.close()
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the events of the deployed contracts into SQLite")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite database file")
+    parser.add_argument("--node", help="http url of the node, nodeHost:nodePort of config.json by default")
+    parser.add_argument("--from-block", type=int, default=0, help="first block of the backfill of a new database")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of eth_getLogs requests in flight")
+    parser.add_argument("--confirmations", type=int, default=0, help="blocks to wait before indexing a log")
+    parser.add_argument("--no-follow", action="store_true", help="stop once the backfill reaches the head")
+    parser.add_argument("--application-id", help="print the indexed events of an application")
+    parser.add_argument("--drc-id", help="print the indexed events of a DRC")
+    parser.add_argument("--applicant", help="print the indexed events listing an applicant")
+    args = parser.parse_args()
+
+    if args.application_id or args.drc_id or args.applicant:
+        for event in query(args.db, args.application_id, args.drc_id, args.applicant):
+            print(json.dumps(event))
+        return
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    node_url = args.node
+    if node_url is None:
+        with open("config.json", "r") as config_file:
+            config = json.load(config_file)
+        node_url = "http://" + config["nodeHost"] + ":" + config["nodePort"]
+    compiled_contracts, contract_addresses = load_deployment()
+    indexer = EventIndexer(Web3(BatchHTTPProvider(node_url)), compiled_contracts, contract_addresses,
+                           db_file=args.db, concurrency=args.concurrency)
+    try:
+        indexer.run(from_block=args.from_block, follow=not args.no_follow, confirmations=args.confirmations)
+    except KeyboardInterrupt:
+        print("stopped at block %s" % indexer.last_block())
+    finally:
+        indexer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Crash safe journal of the transactions sent by the deployer.
+
+Every transaction is appended to ../build/journal/deploy.jsonl when it is sent and again when it is mined, and the
+file is fsynced after every record. If a run fails halfway, `deployer.py --resume` replays the journal: steps whose
+transaction was mined successfully are not sent again, transactions still in flight are waited for, and only the
+remaining steps are executed.
+
+A step is named after what it does, "deploy:TdrStorage" or "wire:TDRManager.loadTdrStorage". The --create2
+pipeline is not journaled: its transactions are planned with fixed nonces, and running it again skips the contracts
+already deployed at their CREATE2 addresses and completes their wiring.
+"""
+
+import datetime
+import json
+import os
+
+from batch_provider import batch_request, format_receipt
+from receipt_tracker import hex_hash
+
+JOURNAL_FILE = "../build/journal/deploy.jsonl"
+
+
+class DeploymentJournal:
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+
+    def _append(self, record):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        record["time"] = datetime.datetime.now().isoformat()
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def reset(self):
+        """
+        Starts a new journal, the previous one is kept next to it with a timestamp.
+        """
+        if os.path.isfile(self.path):
+            os.replace(self.path, self.path + "." + datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+
+    def record_sent(self, step, tx_hash, nonce, **details):
+        """
+        :param details: what the transaction depends on, such as the bytecode hash of a deployment, or the address of
+                        the target contract and the address set by a setter; a step is only resumed if its details
+                        did not change
+        """
+        self._append(dict(details, step=step, state="sent", txHash=tx_hash, nonce=nonce))
+
+    def record_mined(self, step, receipt):
+        self._append({"step": step, "state": "mined", "txHash": hex_hash(receipt['transactionHash']),
+                      "status": receipt['status'], "contractAddress": receipt.get('contractAddress')})
+
+    def replay(self):
+        """
+        :return: dictionary with the step as key and its latest state as value
+        """
+        steps = {}
+        if not os.path.isfile(self.path):
+            return steps
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a crash while appending can leave a truncated last line
+                    continue
+                state = steps.setdefault(record["step"], {})
+                if record["state"] == "sent":
+                    state.clear()
+                state.update(record)
+        return steps
+
+    def recover(self, w3):
+        """
+        Replays the journal and checks the transactions which were sent but not seen mined.
+        :param w3: web3 instance connected to the node
+        :return: dictionary with the step as key and its state as value, for the steps mined successfully
+                 (state "mined") and the ones still in flight (state "sent")
+        """
+        steps = self.replay()
+        sent = [state for state in steps.values() if state["state"] == "sent"]
+        receipts = batch_request(w3, [("eth_getTransactionReceipt", [state["txHash"]]) for state in sent])
+        transactions = batch_request(w3, [("eth_getTransactionByHash", [state["txHash"]]) for state in sent])
+        for state, receipt, transaction in zip(sent, receipts, transactions):
+            if receipt is not None:
+                receipt = format_receipt(receipt)
+                self.record_mined(state["step"], receipt)
+                state.update(state="mined", status=receipt['status'], contractAddress=receipt.get('contractAddress'))
+            elif transaction is None:
+                # dropped by the node, the step has to be done again
+                state["state"] = "dropped"
+        return {step: state for step, state in steps.items()
+                if state["state"] == "sent" or (state["state"] == "mined" and state.get("status") == 1)}
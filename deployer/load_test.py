@@ -0,0 +1,201 @@
+"""
+Load test of the backend, built from the workflow of tests.py.
+
+Every session runs its own TDR -> DRC -> DTA -> DUA lifecycle (the steps of run_all_test), with the ids it creates
+kept in the session instead of module globals, so any number of lifecycles can run at once. The sessions share one
+ApiClient (see api_client.py) with a keep-alive connection per worker. Sessions are started at a configurable arrival
+rate, optionally ramped up linearly from zero, and run in a thread pool. At the end the throughput and the p50/p95/p99
+latency of every endpoint, of every transaction and of every session are printed, and the latency histograms are
+exported to ../build/metrics (see metrics.py).
+
+The sign and status calls are polled by the TransactionTracker, so an answer other than a 200 is not an error of the
+endpoint: it is counted in a separate "<path> refused" row, and whether the transaction went through in the
+"transaction" row.
+
+Usage:
+    python3 load_test.py --sessions 100 --rate 5 --ramp-up 30 --workers 50
+"""
+
+import argparse
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import perf_counter, perf_counter_ns, sleep
+
+import tests
+from api_client import ApiClient, ApiError
+from metrics import HistogramStore
+from tests import notice_payload, tdr_application_payload, officer_payload, dta_payload, dua_payload, sign_payload
+from trx_tracker import TransactionTracker, TransactionFailed
+
+# paths polled by the TransactionTracker, whose answers other than a 200 are retried or end in a TransactionFailed
+POLLED_PATHS = ("/user/transaction/sign", "/user/transaction/status")
+
+
+def report(store, elapsed):
+    """
+    :param store: HistogramStore with the latency of every endpoint
+    :param elapsed: duration of the test in seconds
+    :return: table with the throughput and the latency percentiles of every endpoint
+    """
+    lines = ["%-42s %8s %7s %8s %9s %9s %9s" % ("endpoint", "requests", "errors", "req/s", "p50 ms",
+                                                "p95 ms", "p99 ms")]
+    for row in store.rows():
+        lines.append("%-42s %8d %7d %8.2f %9.1f %9.1f %9.1f" % (
+            row["metric"], row["count"], row["errors"], row["count"] / elapsed, row["p50_ms"], row["p95_ms"],
+            row["p99_ms"]))
+    return "\n".join(lines)
+
+
+class LifecycleSession:
+    """
+    One TDR -> DRC -> DTA -> DUA lifecycle, with its own ids.
+    """
+
+    def __init__(self, api, tracker, stats=None):
+        """
+        :param api: ApiClient shared by the sessions, recording the latency of every request
+        :param tracker: TransactionTracker signing the transactions and waiting for them to be mined
+        :param stats: HistogramStore recording the latency and the failures of the transactions
+        """
+        self.api = api
+        self.tracker = tracker
+        self.stats = stats
+        self.notice_id = None
+        self.tdr_application_id = None
+        self.dta_id = None
+        self.dua_id = None
+
+    def transaction(self, body):
+        """
+        Signs the transaction created by an endpoint and waits until it is mined, like a function decorated with
+        push. The time from the first sign call to the confirmation is recorded under "transaction".
+        :param body: decoded response of the endpoint
+        :return: the data of the response
+        """
+        data = body.get('data')
+        trx_id = data.get('trxId')
+        start = perf_counter_ns()
+        try:
+            self.tracker.confirm(self.tracker.sign(partial(self.api.sign_transaction, sign_payload(trx_id))),
+                                 partial(self.api.transaction_status, trx_id))
+        except TransactionFailed:
+            if self.stats is not None:
+                self.stats.record_error("transaction")
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.record("transaction", "request", perf_counter_ns() - start)
+        return data
+
+    def run(self):
+        """
+        Runs the steps of tests.run_all_test.
+        """
+        api = self.api
+        api.add_user()
+        self.notice_id = self.transaction(api.create_notice(notice_payload())).get('noticeId')
+        self.tdr_application_id = self.transaction(
+            api.create_tdr_application(tdr_application_payload(self.notice_id))).get('applicationId')
+        self.transaction(api.sign_tdr_application(self.tdr_application_id))
+        api.add_officer(officer_payload("verifier"))
+        api.update_officer(officer_payload("admin"))
+        self.transaction(api.verify_tdr_application(self.tdr_application_id))
+        self.transaction(api.approve_tdr_application(self.tdr_application_id))
+        api.tdr_user_sign_status(self.tdr_application_id)
+        self.transaction(api.issue_drc(self.tdr_application_id, 150))
+        self.dta_id = self.transaction(api.create_dta(dta_payload())).get('applicationId')
+        self.transaction(api.sign_dta(self.dta_id))
+        self.transaction(api.verify_dta(self.dta_id))
+        self.transaction(api.approve_dta(self.dta_id))
+        self.dua_id = self.transaction(api.create_dua(dua_payload(self.tdr_application_id))).get('applicationId')
+        self.transaction(api.sign_dua(self.dua_id))
+        api.get_dua(self.dua_id)
+        api.dashboard_data()
+
+
+def arrival_times(sessions, rate, ramp_up=0):
+    """
+    Returns the start time of every session, in seconds from the start of the test.
+    The arrival rate grows linearly from 0 to rate during ramp_up seconds and then stays constant.
+    """
+    times = []
+    for i in range(sessions):
+        # sessions started during the ramp up: rate * t^2 / (2 * ramp_up)
+        if ramp_up > 0 and i < rate * ramp_up / 2:
+            times.append(math.sqrt(2 * ramp_up * i / rate))
+        else:
+            times.append(ramp_up / 2 + i / rate)
+    return times
+
+
+def run_load(sessions, rate, ramp_up=0, workers=50):
+    """
+    Runs sessions lifecycles and prints the report.
+    :param rate: sessions started per second once ramped up
+    :param workers: largest number of sessions running at once
+    :return: the HistogramStore of the test, exported to ../build/metrics
+    """
+    stats = HistogramStore(test="load", sessions=sessions, rate=rate, ramp_up=ramp_up, workers=workers)
+    outcome = {"completed": 0, "failed": 0}
+    lock = threading.Lock()
+    tracker = TransactionTracker(tests.node_url())
+
+    def observe(method, path, status, nanoseconds):
+        if status != 200 and path in POLLED_PATHS:
+            # retried by the tracker, the outcome is recorded by LifecycleSession.transaction
+            stats.record(path + " refused", "request", nanoseconds)
+            return
+        stats.record(path, "request", nanoseconds)
+        if status != 200:
+            stats.record_error(path)
+
+    api = ApiClient(tests.HOST, tests.PORT, tests.JWT, pool_size=workers, observer=observe)
+
+    def run_session(index):
+        start = perf_counter_ns()
+        try:
+            LifecycleSession(api, tracker, stats).run()
+            result = "completed"
+        except (ApiError, TransactionFailed) as e:
+            print("session %d failed: %s" % (index, e))
+            result = "failed"
+        except Exception as e:
+            # an unexpected error must not vanish in the executor, it fails the session like any other
+            print("session %d failed with %s: %s" % (index, type(e).__name__, e))
+            result = "failed"
+        if result == "failed":
+            stats.record_error("session")
+        stats.record("session", "request", perf_counter_ns() - start)
+        with lock:
+            outcome[result] += 1
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, start_time in enumerate(arrival_times(sessions, rate, ramp_up)):
+            delay = start + start_time - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            executor.submit(run_session, index)
+    elapsed = perf_counter() - start
+    api.close()
+    print("%d sessions completed, %d failed in %.1fs, %.2f sessions/s" % (
+        outcome["completed"], outcome["failed"], elapsed, outcome["completed"] / elapsed))
+    print(report(stats, elapsed))
+    print("metrics written to " + stats.export())
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run concurrent TDR/DRC lifecycles against the backend")
+    parser.add_argument("--sessions", type=int, default=10, help="number of lifecycles to run")
+    parser.add_argument("--rate", type=float, default=1, help="lifecycles started per second")
+    parser.add_argument("--ramp-up", type=float, default=0, help="seconds to ramp the rate up from zero")
+    parser.add_argument("--workers", type=int, default=50, help="largest number of lifecycles running at once")
+    args = parser.parse_args()
+    run_load(args.sessions, args.rate, args.ramp_up, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Latency histograms of the backend tests.
+
+Durations are measured with perf_counter_ns and recorded in log-linear histograms: a value is kept with its 6 most
+significant bits, so every percentile is within 3% of the exact value whatever the number of samples, and a whole
+run fits in a small JSON file. Histograms are grouped by metric (a test step or an endpoint) and phase (build,
+create, trxId, sign, confirm...).
+
+A run is exported as JSON (every bucket, so it can be reloaded and compared) and as CSV (one row of percentiles per
+metric and phase), and two runs are compared with:
+    python3 metrics.py compare ../build/metrics/<before>.json ../build/metrics/<after>.json
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import threading
+from time import perf_counter_ns
+
+METRICS_DIR = "../build/metrics"
+# significant bits kept for each value
+SIGNIFICANT_BITS = 6
+PERCENTILES = (50, 90, 95, 99)
+
+
+def bucket_of(value):
+    """
+    Returns the lower bound of the bucket of a value, the value with its low bits cleared.
+    """
+    shift = max(0, value.bit_length() - SIGNIFICANT_BITS)
+    return (value >> shift) << shift
+
+
+def bucket_width(lower):
+    return 1 << max(0, lower.bit_length() - SIGNIFICANT_BITS)
+
+
+class Histogram:
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        value = max(0, int(value))
+        lower = bucket_of(value)
+        self.buckets[lower] = self.buckets.get(lower, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        """
+        Returns the middle of the bucket holding the p-th percentile, clipped to the recorded range.
+        """
+        if not self.count:
+            return 0
+        rank = max(1, -(-p * self.count // 100))
+        seen = 0
+        for lower in sorted(self.buckets):
+            seen += self.buckets[lower]
+            if seen >= rank:
+                return min(self.max, max(self.min, lower + bucket_width(lower) // 2))
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self):
+        return {"count": self.count, "total": self.total, "min": self.min, "max": self.max,
+                "buckets": {str(lower): count for lower, count in sorted(self.buckets.items())}}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.buckets = {int(lower): count for lower, count in data["buckets"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class HistogramStore:
+    """
+    Thread safe histograms of nanosecond durations, by metric and phase, plus the error counts.
+    """
+
+    def __init__(self, **labels):
+        """
+        :param labels: description of the run saved with the histograms, such as the backend url
+        """
+        self.labels = dict(labels, started=datetime.datetime.now().isoformat(), host=platform.node())
+        self.histograms = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, metric, phase, nanoseconds):
+        with self._lock:
+            self.histograms.setdefault(metric, {}).setdefault(phase, Histogram()).record(nanoseconds)
+
+    def record_error(self, metric):
+        with self._lock:
+            self.errors[metric] = self.errors.get(metric, 0) + 1
+
+    def rows(self):
+        """
+        :return: list of dictionaries with the count, mean, min, max and PERCENTILES in milliseconds of every
+                 metric and phase
+        """
+        rows = []
+        with self._lock:
+            for metric in sorted(self.histograms):
+                for phase, histogram in self.histograms[metric].items():
+                    row = {"metric": metric, "phase": phase, "count": histogram.count,
+                           "errors": self.errors.get(metric, 0), "mean_ms": histogram.mean() / 1e6,
+                           "min_ms": histogram.min / 1e6, "max_ms": histogram.max / 1e6}
+                    for p in PERCENTILES:
+                        row["p%d_ms" % p] = histogram.percentile(p) / 1e6
+                    rows.append(row)
+        return rows
+
+    def summary(self):
+        lines = ["%-40s %-8s %7s %7s %9s %9s %9s %9s" % ("metric", "phase", "count", "errors", "mean ms",
+                                                        "p50 ms", "p95 ms", "p99 ms")]
+        for row in self.rows():
+            lines.append("%-40s %-8s %7d %7d %9.1f %9.1f %9.1f %9.1f" % (
+                row["metric"][:40], row["phase"], row["count"], row["errors"], row["mean_ms"], row["p50_ms"],
+                row["p95_ms"], row["p99_ms"]))
+        return "\n".join(lines)
+
+    def export(self, name=None, directory=METRICS_DIR):
+        """
+        Writes the run to <directory>/<name>.json and <directory>/<name>.csv.
+        :param name: name of the run, its start time by default
+        :return: path of the json file
+        """
+        if name is None:
+            name = self.labels["started"].replace(":", "").split(".")[0]
+        os.makedirs(directory, exist_ok=True)
+        json_file = os.path.join(directory, name + ".json")
+        with self._lock:
+            data = {"labels": self.labels, "errors": self.errors,
+                    "histograms": {metric: {phase: histogram.to_dict() for phase, histogram in phases.items()}
+                                   for metric, phases in self.histograms.items()}}
+        with open(json_file, 'w') as f:
+            json.dump(data, f, indent=1)
+        rows = self.rows()
+        with open(os.path.join(directory, name + ".csv"), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["metric", "phase"])
+            writer.writeheader()
+            writer.writerows(rows)
+        return json_file
+
+    @classmethod
+    def load(cls, json_file):
+        with open(json_file, 'r') as f:
+            data = json.load(f)
+        store = cls()
+        store.labels = data["labels"]
+        store.errors = data["errors"]
+        store.histograms = {metric: {phase: Histogram.from_dict(histogram) for phase, histogram in phases.items()}
+                            for metric, phases in data["histograms"].items()}
+        return store
+
+
+class PhaseTimer:
+    """
+    Times the consecutive phases of one operation: every mark records the time since the previous one.
+    """
+
+    def __init__(self, store, metric):
+        self.store = store
+        self.metric = metric
+        self.start = self.last = perf_counter_ns()
+
+    def mark(self, phase):
+        now = perf_counter_ns()
+        self.store.record(self.metric, phase, now - self.last)
+        self.last = now
+
+    def finish(self, phase="total"):
+        """
+        Records the time since the creation of the timer.
+        :return: the recorded time, in nanoseconds
+        """
+        elapsed = perf_counter_ns() - self.start
+        self.store.record(self.metric, phase, elapsed)
+        return elapsed
+
+
+class NoTimer:
+    """
+    Stands in for a PhaseTimer outside of a timed operation.
+    """
+
+    def mark(self, phase):
+        pass
+
+    def finish(self, phase="total"):
+        return 0
+
+
+def compare(before, after):
+    """
+    :return: table with the p50 and p95 of every metric and phase of two runs, and their relative change
+    """
+    lines = ["%-40s %-8s %10s %10s %8s %10s %10s %8s" % ("metric", "phase", "p50 before", "p50 after", "change",
+                                                       "p95 before", "p95 after", "change")]
+    for metric in sorted(set(before.histograms) | set(after.histograms)):
+        phases = set(before.histograms.get(metric, {})) | set(after.histograms.get(metric, {}))
+        for phase in sorted(phases):
+            values = []
+            for p in (50, 95):
+                old = before.histograms.get(metric, {}).get(phase, Histogram()).percentile(p) / 1e6
+                new = after.histograms.get(metric, {}).get(phase, Histogram()).percentile(p) / 1e6
+                change = "%+7.1f%%" % ((new - old) / old * 100) if old else "     n/a"
+                values.extend([old, new, change])
+            lines.append("%-40s %-8s %10.1f %10.1f %8s %10.1f %10.1f %8s" % ((metric[:40], phase) + tuple(values)))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the latency histograms of two test runs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare_parser = subparsers.add_parser("compare", help="compare two runs exported as json")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    args = parser.parse_args()
+    print(compare(HistogramStore.load(args.before), HistogramStore.load(args.after)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Local nonce allocation for the deployer.
+
+Reading the nonce with getTransactionCount before every transaction costs one RPC per transaction and returns the
+same value until the previous transaction is mined, which prevents sending transactions back to back. The
+NonceManager reads the pending transaction count once and then hands out consecutive nonces from memory.
+"""
+
+import heapq
+import threading
+
+# messages returned by geth/quorum when the nonce used by a transaction is out of date
+NONCE_ERRORS = ("nonce too low", "replacement transaction underpriced")
+# messages returned by geth/quorum when this exact signed transaction is already in the pool
+KNOWN_TRANSACTION_ERRORS = ("known transaction", "already known")
+
+
+def is_nonce_error(error):
+    message = str(error).lower()
+    return any(nonce_error in message for nonce_error in NONCE_ERRORS)
+
+
+def is_known_transaction(error):
+    message = str(error).lower()
+    return any(known_error in message for known_error in KNOWN_TRANSACTION_ERRORS)
+
+
+class NonceManager:
+    """
+    Hands out the nonces of an account.
+    Allocation is protected by a lock, so the manager can be shared between threads. It never blocks on the
+    network while holding the lock except to resync, so it can also be used from asyncio code.
+    """
+
+    def __init__(self, w3, address):
+        self.w3 = w3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next_nonce = None
+        # nonces allocated but given back unused, handed out again before new ones
+        self._released = []
+
+    def resync(self):
+        """
+        Reads the pending transaction count of the account from the node.
+        """
+        with self._lock:
+            self._next_nonce = self.w3.eth.getTransactionCount(self.address, 'pending')
+            self._released = []
+            return self._next_nonce
+
+    def next(self):
+        """
+        Returns the next free nonce of the account.
+        """
+        with self._lock:
+            if self._released:
+                return heapq.heappop(self._released)
+            if self._next_nonce is None:
+                self._next_nonce = self.w3.eth.getTransactionCount(self.address, 'pending')
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            return nonce
+
+    def release(self, nonce):
+        """
+        Gives back a nonce which no sent transaction uses, so that it does not leave a gap holding back the
+        transactions sent with the following nonces.
+        """
+        with self._lock:
+            if self._next_nonce == nonce + 1:
+                self._next_nonce = nonce
+            else:
+                heapq.heappush(self._released, nonce)
+
+    def send(self, build_transaction, account, retries=3):
+        """
+        Signs and sends a transaction with the next nonce.
+        If the node rejects the nonce ("nonce too low", "replacement transaction underpriced"), the manager resyncs
+        with the node and the transaction is rebuilt with a fresh nonce. If the node already has this exact
+        transaction ("already known"), it is not sent again and its hash is returned. The nonce is released if the
+        transaction cannot be built or is rejected for another reason.
+        :param build_transaction: function taking a nonce and returning the transaction to sign
+        :param account: account signing the transaction
+        :param retries: number of resyncs before giving up
+        :return: tuple (transaction hash, nonce used)
+        """
+        for attempt in range(retries + 1):
+            nonce = self.next()
+            try:
+                signed_transaction = account.signTransaction(build_transaction(nonce))
+            except Exception:
+                self.release(nonce)
+                raise
+            try:
+                return self.w3.eth.sendRawTransaction(signed_transaction.rawTransaction), nonce
+            except ValueError as e:
+                if is_known_transaction(e):
+                    return signed_transaction.hash, nonce
+                if not is_nonce_error(e):
+                    self.release(nonce)
+                    raise
+                if attempt == retries:
+                    raise
+                self.resync()
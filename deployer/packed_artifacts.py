@@ -0,0 +1,169 @@
+"""
+Packed artifact bundle.
+
+The ABI and bytecode of every contract are also written to a single file, ../build/packed/contracts.kdab, so the
+backend and the event parser do not have to open and parse one .abi and one .bin file per contract at startup:
+
+    magic b"KDAB", format version (uint16), header length (uint32), header (json), data
+
+The header holds the offset and length in the data section of the compact JSON ABI and of the raw bytecode of each
+contract, and the tables of the 4-byte function selectors and event topics, each mapped to the contracts and
+signatures which use it. ArtifactBundle memory-maps the file and only decodes the ABI of a contract when it is
+first used.
+
+Usage:
+    bundle = ArtifactBundle("contracts.kdab")
+    bundle.abi("DRCManager")
+    bundle.events_by_topic(log["topics"][0])
+"""
+
+import json
+import mmap
+import struct
+
+from eth_utils import keccak
+
+MAGIC = b"KDAB"
+VERSION = 1
+PREAMBLE = struct.Struct(">4sHI")
+PACKED_FILE = "../build/packed/contracts.kdab"
+
+
+def canonical_type(parameter):
+    """
+    Returns the type of an ABI parameter as it appears in signatures, expanding structs into tuples.
+    """
+    abi_type = parameter["type"]
+    if abi_type.startswith("tuple"):
+        return "(" + ",".join(canonical_type(component) for component in parameter["components"]) + ")" + \
+               abi_type[len("tuple"):]
+    return abi_type
+
+
+def abi_signature(entry):
+    """
+    Returns the signature of a function or event ABI entry, such as "DtaVerified(bytes32,bytes32[])".
+    """
+    return entry["name"] + "(" + ",".join(canonical_type(parameter) for parameter in entry.get("inputs", [])) + ")"
+
+
+def selector_tables(compiled_contracts):
+    """
+    Computes the function selectors and the event topics of the compiled contracts.
+    :return: tuple (selectors, topics), dictionaries with the hex selector or topic as key and the list of the
+             [contract, signature] using it as value
+    """
+    selectors = {}
+    topics = {}
+    for contract in sorted(compiled_contracts):
+        for entry in compiled_contracts[contract].get('abi', []):
+            if entry.get("type") not in ("function", "event"):
+                continue
+            signature = abi_signature(entry)
+            digest = keccak(text=signature)
+            if entry["type"] == "function":
+                selectors.setdefault("0x" + digest[:4].hex(), []).append([contract, signature])
+            else:
+                topics.setdefault("0x" + digest.hex(), []).append([contract, signature])
+    return selectors, topics
+
+
+def pack(compiled_contracts):
+    """
+    Serializes the compiled contracts into a bundle.
+    :param compiled_contracts: dictionary with the contract name as key and its abi and bin as value
+    :return: the bytes of the bundle
+    """
+    data = bytearray()
+    contracts = {}
+    for contract in sorted(compiled_contracts):
+        value = compiled_contracts[contract]
+        abi = json.dumps(value.get('abi', []), separators=(',', ':')).encode()
+        entry = {"abi": [len(data), len(abi)]}
+        data += abi
+        bytecode = value.get('bin') or ""
+        try:
+            code = bytes.fromhex(bytecode[2:] if bytecode.startswith("0x") else bytecode)
+            entry["linked"] = True
+        except ValueError:
+            # library placeholders are not hex, such bytecode is kept as text
+            code = bytecode.encode()
+            entry["linked"] = False
+        entry["bin"] = [len(data), len(code)]
+        data += code
+        contracts[contract] = entry
+    selectors, topics = selector_tables(compiled_contracts)
+    header = json.dumps({"contracts": contracts, "selectors": selectors, "topics": topics},
+                        separators=(',', ':')).encode()
+    return PREAMBLE.pack(MAGIC, VERSION, len(header)) + header + bytes(data)
+
+
+class ArtifactBundle:
+
+    def __init__(self, path=PACKED_FILE):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = PREAMBLE.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d artifact bundle" % (path, VERSION))
+        header = json.loads(self._map[PREAMBLE.size:PREAMBLE.size + header_length])
+        self._data_offset = PREAMBLE.size + header_length
+        self._contracts = header["contracts"]
+        self.selectors = header["selectors"]
+        self.topics = header["topics"]
+        self._abis = {}
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def contracts(self):
+        return list(self._contracts)
+
+    def _slice(self, location):
+        offset, length = location
+        return self._map[self._data_offset + offset:self._data_offset + offset + length]
+
+    def abi(self, contract):
+        """
+        Returns the ABI of a contract, decoded on first access.
+        """
+        if contract not in self._abis:
+            self._abis[contract] = json.loads(self._slice(self._contracts[contract]["abi"]))
+        return self._abis[contract]
+
+    def bytecode(self, contract):
+        """
+        Returns the bytecode of a contract as bytes.
+        """
+        entry = self._contracts[contract]
+        if not entry["linked"]:
+            raise ValueError("the bytecode of %s has unlinked libraries" % contract)
+        return self._slice(entry["bin"])
+
+    def bytecode_hex(self, contract):
+        """
+        Returns the bytecode of a contract as hex text, as in the .bin files.
+        """
+        entry = self._contracts[contract]
+        code = self._slice(entry["bin"])
+        return code.hex() if entry["linked"] else code.decode()
+
+    def functions_by_selector(self, selector):
+        """
+        :param selector: hex 4-byte selector, such as the first 10 characters of the input of a transaction
+        :return: list of [contract, signature]
+        """
+        return self.selectors.get(selector.lower(), [])
+
+    def events_by_topic(self, topic):
+        """
+        :param topic: hex topic0 of a log
+        :return: list of [contract, signature]
+        """
+        return self.topics.get(topic.lower(), [])
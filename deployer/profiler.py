@@ -0,0 +1,157 @@
+"""
+Phase profiler for the deployer.
+
+Records spans for the compilation, the artifact writes, every deployment and wiring step and every receipt wait,
+together with the JSON-RPC round trips and the signatures made inside them. The spans are written as a Chrome trace
+(open it in chrome://tracing, Perfetto or speedscope for a flamegraph) and summarised in a table of the slowest
+steps, with the time of each step split between RPC round trips, signing and waiting for blocks.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from time import perf_counter_ns
+
+TRACE_FILE = "../build/profile/trace.json"
+# categories of the spans whose time is attributed to the step containing them
+BREAKDOWN_CATEGORIES = ("rpc", "sign", "wait")
+# categories listed in the summary table, "tx" spans go from the sending of a transaction to its receipt
+SUMMARY_CATEGORIES = ("phase", "step", "tx")
+# trace lane of the transaction latencies, which do not belong to a thread
+TRANSACTIONS_TID = 0
+
+
+class Profiler:
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = []
+        self._lock = threading.Lock()
+        self._origin = perf_counter_ns()
+
+    @contextmanager
+    def span(self, name, category="step", **args):
+        """
+        Records the time spent in the with block.
+        :param name: name of the span, such as "deploy:TdrStorage"
+        :param category: one of SUMMARY_CATEGORIES or BREAKDOWN_CATEGORIES
+        """
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self._record(name, category, start, perf_counter_ns(), threading.get_ident(), args)
+
+    def _record(self, name, category, start, end, tid, args):
+        with self._lock:
+            self.spans.append({"name": name, "cat": category, "start": start - self._origin,
+                               "end": end - self._origin, "tid": tid, "args": args})
+
+    def track(self, name, tx_hash, future):
+        """
+        Records the latency of a transaction, from now until its receipt resolves the future.
+        :param future: future resolved with the receipt, as returned by ReceiptTracker.watch
+        """
+        if not self.enabled:
+            return
+        start = perf_counter_ns()
+
+        def resolved(_):
+            self._record("tx:" + name, "tx", start, perf_counter_ns(), TRANSACTIONS_TID, {"txHash": tx_hash})
+
+        future.add_done_callback(resolved)
+
+    def middleware(self, make_request, w3):
+        """
+        web3 middleware recording every JSON-RPC request as a span of category rpc.
+        """
+
+        def profiled_request(method, params):
+            with self.span("rpc:" + method, "rpc"):
+                return make_request(method, params)
+
+        return profiled_request
+
+    def instrument_batches(self, provider):
+        """
+        Records the JSON-RPC batches of a BatchHTTPProvider, which do not go through the middlewares.
+        """
+        make_batch_request = provider.make_batch_request
+
+        def profiled_batch_request(calls):
+            methods = sorted(set(method for method, _ in calls))
+            with self.span("rpc:batch[%s]" % ",".join(methods), "rpc", size=len(calls)):
+                return make_batch_request(calls)
+
+        provider.make_batch_request = profiled_batch_request
+
+    def signer(self, account):
+        """
+        Wraps an account so that its signatures are recorded as spans of category sign.
+        """
+        profiler = self
+
+        class ProfiledAccount:
+            address = account.address
+
+            def signTransaction(self, transaction):
+                with profiler.span("sign", "sign"):
+                    return account.signTransaction(transaction)
+
+        return ProfiledAccount()
+
+    def breakdown(self, span):
+        """
+        Splits the duration of a span between the spans of BREAKDOWN_CATEGORIES made inside it on the same thread.
+        :return: dictionary with the milliseconds spent in each category, and in none of them ("other")
+        """
+        result = {category: 0.0 for category in BREAKDOWN_CATEGORIES}
+        total = (span["end"] - span["start"]) / 1e6
+        if span["cat"] == "tx":
+            # a transaction only waits for its block once it is sent
+            result["wait"] = total
+            result["other"] = 0.0
+            return result
+        for inner in self.spans:
+            if inner is span or inner["tid"] != span["tid"] or inner["cat"] not in BREAKDOWN_CATEGORIES:
+                continue
+            if inner["start"] >= span["start"] and inner["end"] <= span["end"]:
+                result[inner["cat"]] += (inner["end"] - inner["start"]) / 1e6
+        result["other"] = max(0.0, total - sum(result.values()))
+        return result
+
+    def write_trace(self, path=TRACE_FILE):
+        """
+        Writes the spans in the Chrome trace event format.
+        """
+        pid = os.getpid()
+        events = [{"name": span["name"], "cat": span["cat"], "ph": "X", "ts": span["start"] / 1000,
+                   "dur": (span["end"] - span["start"]) / 1000, "pid": pid, "tid": span["tid"],
+                   "args": span["args"]} for span in self.spans]
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": TRANSACTIONS_TID,
+                       "args": {"name": "transactions"}})
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+    def summary(self, top=20):
+        """
+        Returns a table of the slowest phases, steps and transactions, with the breakdown of their time.
+        """
+        spans = [span for span in self.spans if span["cat"] in SUMMARY_CATEGORIES]
+        spans.sort(key=lambda span: span["end"] - span["start"], reverse=True)
+        lines = ["%-45s %10s %10s %10s %10s %10s" % ("span", "total ms", "rpc ms", "sign ms", "wait ms", "other ms")]
+        for span in spans[:top]:
+            breakdown = self.breakdown(span)
+            lines.append("%-45s %10.1f %10.1f %10.1f %10.1f %10.1f" % (
+                span["name"][:45], (span["end"] - span["start"]) / 1e6, breakdown["rpc"], breakdown["sign"],
+                breakdown["wait"], breakdown["other"]))
+        rpc_spans = [span for span in self.spans if span["cat"] == "rpc"]
+        lines.append("%d rpc requests, %.1f ms in total" % (
+            len(rpc_spans), sum(span["end"] - span["start"] for span in rpc_spans) / 1e6))
+        return "\n".join(lines)
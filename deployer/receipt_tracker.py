@@ -0,0 +1,160 @@
+"""
+Event driven receipt tracking for the deployer.
+
+waitForTransactionReceipt polls the node on a fixed interval for every transaction, which adds latency and floods
+the node when many transactions are in flight. The ReceiptTracker subscribes to newHeads over a WebSocket instead:
+on every new block it fetches the transaction hashes of the block once and resolves the futures of the pending
+transactions found in it. Without a WebSocket it falls back to a single poller shared by all the pending
+transactions, asking for all their receipts in one JSON-RPC batch per poll.
+"""
+
+import asyncio
+import json
+import threading
+from time import sleep
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, wait as wait_futures
+
+import websockets
+from hexbytes import HexBytes
+
+from batch_provider import batch_request, format_receipt
+
+
+def hex_hash(tx_hash):
+    """
+    Returns a transaction hash given as bytes, HexBytes or a hex string as a lower case 0x prefixed string, the form
+    used as key by the tracker and returned by the node.
+    """
+    return HexBytes(tx_hash).hex()
+
+
+class ReceiptTracker:
+
+    def __init__(self, w3, ws_url=None, poll_latency=0.5, logger=None):
+        """
+        :param w3: web3 instance used to fetch blocks and receipts
+        :param ws_url: WebSocket url of the node, the tracker polls if it is None or unreachable
+        :param poll_latency: seconds between two polls of the fallback poller
+        """
+        self.w3 = w3
+        self.ws_url = ws_url
+        self.poll_latency = poll_latency
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._pending = {}
+        # hashes registered since the last block, they may have been mined in a block seen before their registration
+        self._unchecked = set()
+        self._ws_thread = None
+        self._poller_thread = None
+        self._ws_failed = ws_url is None
+
+    def watch(self, tx_hash):
+        """
+        Starts tracking a transaction.
+        :return: a concurrent.futures.Future resolved with the receipt of the transaction
+        """
+        tx_hash = hex_hash(tx_hash)
+        with self._lock:
+            future = self._pending.get(tx_hash)
+            if future is None:
+                future = Future()
+                self._pending[tx_hash] = future
+                self._unchecked.add(tx_hash)
+            self._start()
+        return future
+
+    def wait(self, tx_hash, timeout=120):
+        """
+        Blocks until the receipt of the transaction is available.
+        """
+        return self.watch(tx_hash).result(timeout=timeout)
+
+    def wait_all(self, tx_hashes, timeout=120):
+        """
+        Blocks until the receipts of all the transactions are available.
+        :return: dictionary with the hex transaction hash as key and the receipt as value
+        """
+        futures = {hex_hash(tx_hash): self.watch(tx_hash) for tx_hash in tx_hashes}
+        _, not_done = wait_futures(futures.values(), timeout=timeout)
+        if not_done:
+            raise FutureTimeoutError("transactions %s not mined after %s seconds" %
+                                     (sorted(h for h, f in futures.items() if f in not_done), timeout))
+        return {tx_hash: future.result() for tx_hash, future in futures.items()}
+
+    def _start(self):
+        # called with the lock held
+        if not self._ws_failed:
+            if self._ws_thread is None or not self._ws_thread.is_alive():
+                self._ws_thread = threading.Thread(target=self._run_subscription, daemon=True)
+                self._ws_thread.start()
+        elif self._poller_thread is None or not self._poller_thread.is_alive():
+            self._poller_thread = threading.Thread(target=self._run_poller, daemon=True)
+            self._poller_thread.start()
+
+    def _resolve(self, tx_hashes):
+        """
+        Fetches the receipts of the transactions in one batch and resolves the futures of the mined ones.
+        """
+        tx_hashes = sorted(tx_hashes)
+        if not tx_hashes:
+            return
+        receipts = batch_request(self.w3, [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes])
+        for tx_hash, receipt in zip(tx_hashes, receipts):
+            if receipt is None:
+                continue
+            with self._lock:
+                future = self._pending.pop(tx_hash, None)
+                self._unchecked.discard(tx_hash)
+            if future is not None:
+                future.set_result(format_receipt(receipt))
+
+    def _on_block(self, block_hash):
+        block = batch_request(self.w3, [("eth_getBlockByHash", [block_hash, False])])[0]
+        in_block = set(block.get("transactions", [])) if block else set()
+        with self._lock:
+            candidates = (in_block & set(self._pending)) | self._unchecked
+            self._unchecked = set()
+        self._resolve(candidates)
+
+    def _run_subscription(self):
+        try:
+            asyncio.run(self._subscribe())
+        except Exception as e:
+            if self.logger:
+                self.logger.warning("newHeads subscription on %s failed, polling receipts instead: %s",
+                                    self.ws_url, e)
+            with self._lock:
+                self._ws_failed = True
+                if self._pending:
+                    self._start()
+
+    async def _subscribe(self):
+        async with websockets.connect(self.ws_url) as ws:
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}))
+            response = json.loads(await ws.recv())
+            if "error" in response:
+                raise ValueError(response["error"])
+            # transactions registered before the subscription was active
+            with self._lock:
+                unchecked, self._unchecked = self._unchecked, set()
+            self._resolve(unchecked)
+            async for message in ws:
+                head = json.loads(message).get("params", {}).get("result")
+                if head and head.get("hash"):
+                    self._on_block(head["hash"])
+
+    def _run_poller(self):
+        while True:
+            with self._lock:
+                pending = set(self._pending)
+                self._unchecked = set()
+                if not pending:
+                    # the next watch() starts a new poller
+                    self._poller_thread = None
+                    return
+            try:
+                self._resolve(pending)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning("receipt poll failed: %s", e)
+            sleep(self.poll_latency)
@@ -0,0 +1,594 @@
+"""
+Local stand-ins of the Quorum node and of the backend, so that deployer.py, tests.py and load_test.py can be
+benchmarked on a single machine without any live service.
+
+ChainSimulator answers the JSON-RPC calls of the deployer, single or batched: signed raw transactions are decoded,
+their sender recovered and their nonce checked, and they are mined every block_time seconds, or as soon as they are
+received when block_time is 0, with a receipt for each. The EVM is not run: a contract creation stores its init code
+as the code of the new address, any other transaction succeeds, and eth_call returns a zero word. Contracts created by
+a contract, such as the KdaFactory of the CREATE2 mode, are therefore not known to the simulator.
+
+BackendSimulator answers the /tdr, /drc and /user routes called through api_client.py. Every call creating a
+transaction returns a new trxId, and signing it sends a transaction to the ChainSimulator when there is one, whose
+hash is returned so that trx_tracker.py waits for it to be mined. /user/transaction/status reports whether it is.
+
+Both add a configurable latency to every HTTP request, and both run in the calling process: start_server serves
+either of them from a background thread, which is what the command line does:
+    python3 simulator.py --chain-port 8545 --backend-port 8000 --block-time 1 --chain-latency 0.005
+deployer.py then runs against the simulator with nodeHost set to 127.0.0.1 and nodePort to "8545" in config.json.
+"""
+
+import argparse
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+
+import rlp
+from eth_keys import keys
+from eth_utils import keccak, to_checksum_address
+
+from create2 import create_address
+
+SIMULATOR_CHAIN_ID = 1337
+ZERO_ADDRESS = "0x" + "00" * 20
+ZERO_WORD = "0x" + "00" * 32
+EMPTY_BLOOM = "0x" + "00" * 256
+BLOCK_GAS_LIMIT = 0x7fffffff
+# account and contract through which BackendSimulator sends the transactions it signs
+BACKEND_ACCOUNT = to_checksum_address("0x" + keccak(text="backend account").hex()[-40:])
+BACKEND_CONTRACT = to_checksum_address("0x" + keccak(text="backend contract").hex()[-40:])
+
+
+def intrinsic_gas(data, creation):
+    """
+    Returns the gas used by a transaction which runs no code: the base cost and the cost of its data.
+    """
+    gas = 53000 if creation else 21000
+    return gas + sum(4 if byte == 0 else 16 for byte in data)
+
+
+def to_int(value):
+    return int.from_bytes(value, "big")
+
+
+def decode_raw_transaction(raw):
+    """
+    Decodes a signed legacy, EIP-2930 or EIP-1559 transaction and recovers its sender.
+    :param raw: the signed transaction, as sent with eth_sendRawTransaction
+    :return: dictionary with the sender, chainId (None if the signature does not commit to one), nonce, gas, gasPrice,
+             to (None for a contract creation), value and data of the transaction
+    :raise ValueError: if the transaction cannot be decoded or its signature is invalid
+    """
+    try:
+        if raw[0] >= 0xc0:
+            fields = rlp.decode(raw)
+            nonce, gas_price, gas, to, value, data, v, r, s = fields
+            v = to_int(v)
+            if v in (27, 28):
+                chain_id, recovery, unsigned = None, v - 27, fields[:6]
+            elif v in (37, 38):
+                # private transaction of Quorum
+                chain_id, recovery, unsigned = None, v - 37, fields[:6]
+            else:
+                chain_id, recovery = (v - 35) // 2, (v - 35) % 2
+                unsigned = fields[:6] + [chain_id, 0, 0]
+            message = rlp.encode(unsigned)
+        elif raw[0] in (1, 2):
+            fields = rlp.decode(raw[1:])
+            if raw[0] == 1:
+                chain_id, nonce, gas_price, gas, to, value, data = fields[:7]
+            else:
+                chain_id, nonce, _, gas_price, gas, to, value, data = fields[:8]
+            chain_id, recovery, r, s = to_int(chain_id), to_int(fields[-3]), fields[-2], fields[-1]
+            message = raw[:1] + rlp.encode(fields[:-3])
+        else:
+            raise ValueError("unsupported transaction type %d" % raw[0])
+        signature = keys.Signature(vrs=(recovery, to_int(r), to_int(s)))
+        sender = signature.recover_public_key_from_msg_hash(keccak(message)).to_checksum_address()
+    except (rlp.DecodingError, ValueError, IndexError) as e:
+        raise ValueError("invalid transaction: %s" % e)
+    except Exception as e:
+        # eth_keys raises its own exceptions for invalid signatures
+        raise ValueError("invalid signature: %s" % e)
+    return {"from": sender, "chainId": chain_id, "nonce": to_int(nonce), "gas": to_int(gas),
+            "gasPrice": to_int(gas_price), "to": to_checksum_address(to) if to else None, "value": to_int(value),
+            "input": "0x" + data.hex()}
+
+
+class ChainSimulator:
+    """
+    Thread safe in memory chain answering JSON-RPC requests.
+    """
+
+    def __init__(self, chain_id=SIMULATOR_CHAIN_ID, block_time=0, latency=0):
+        """
+        :param block_time: seconds between two blocks, transactions are mined as soon as they are received if 0
+        :param latency: seconds added to every HTTP request
+        """
+        self.chain_id = chain_id
+        self.block_time = block_time
+        self.latency = latency
+        self._lock = threading.RLock()
+        # next nonce to be mined and queued transactions by nonce, for each lower case sender
+        self.nonces = {}
+        self.queued = {}
+        self.transactions = {}
+        self.receipts = {}
+        self.code = {}
+        self.blocks = []
+        self.blocks_by_hash = {}
+        self._seal_block([])
+        self.methods = {
+            "web3_clientVersion": lambda: "KdaSimulator/v1",
+            "net_version": lambda: str(self.chain_id),
+            "net_listening": lambda: True,
+            "eth_syncing": lambda: False,
+            "eth_chainId": lambda: hex(self.chain_id),
+            "eth_blockNumber": lambda: hex(len(self.blocks) - 1),
+            "eth_gasPrice": lambda: "0x0",
+            "eth_getBalance": lambda address, block="latest": "0x0",
+            "eth_getTransactionCount": self.get_transaction_count,
+            "eth_estimateGas": self.estimate_gas,
+            "eth_sendRawTransaction": self.send_raw_transaction,
+            "eth_getTransactionByHash": self.get_transaction,
+            "eth_getTransactionReceipt": self.get_receipt,
+            "eth_getCode": self.get_code,
+            "eth_call": lambda call, block="latest": ZERO_WORD,
+            "eth_getBlockByNumber": lambda number, full=False: self.get_block(self.block_number(number), full),
+            "eth_getBlockByHash": lambda block_hash, full=False: self.get_block(
+                self.blocks_by_hash.get(block_hash.lower()), full),
+            "eth_getLogs": lambda log_filter: [],
+        }
+        self._stopped = threading.Event()
+        if block_time > 0:
+            threading.Thread(target=self._mine_blocks, name="simulator-miner", daemon=True).start()
+
+    def respond(self, method, path, headers, body):
+        """
+        Answers an HTTP request holding a JSON-RPC call or batch.
+        :return: tuple (http status, json response)
+        """
+        sleep(self.latency)
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 200, {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "parse error"}}
+        if isinstance(request, list):
+            return 200, [self.call(single) for single in request]
+        return 200, self.call(request)
+
+    def call(self, request):
+        """
+        Answers a single JSON-RPC call.
+        """
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        method = self.methods.get(request.get("method"))
+        if method is None:
+            response["error"] = {"code": -32601, "message": "method %s not supported" % request.get("method")}
+            return response
+        try:
+            response["result"] = method(*request.get("params", []))
+        except (TypeError, KeyError, AttributeError) as e:
+            response["error"] = {"code": -32602, "message": "invalid params: %s" % e}
+        except ValueError as e:
+            response["error"] = {"code": -32000, "message": str(e)}
+        return response
+
+    def block_number(self, tag):
+        if tag in ("latest", "pending", "safe", "finalized"):
+            return len(self.blocks) - 1
+        if tag == "earliest":
+            return 0
+        return int(tag, 16)
+
+    def pending_nonce(self, sender):
+        nonce = self.nonces.get(sender, 0)
+        while nonce in self.queued.get(sender, {}):
+            nonce += 1
+        return nonce
+
+    def get_transaction_count(self, address, block="latest"):
+        with self._lock:
+            if block == "pending":
+                return hex(self.pending_nonce(address.lower()))
+            return hex(self.nonces.get(address.lower(), 0))
+
+    def estimate_gas(self, transaction, block="latest"):
+        data = bytes.fromhex(transaction.get("data", transaction.get("input", "0x"))[2:])
+        return hex(intrinsic_gas(data, not transaction.get("to")))
+
+    def send_raw_transaction(self, raw):
+        transaction = decode_raw_transaction(bytes.fromhex(raw[2:]))
+        if transaction["chainId"] not in (None, self.chain_id):
+            raise ValueError("invalid chain id %s" % transaction["chainId"])
+        transaction["hash"] = "0x" + keccak(hexstr=raw).hex()
+        return self.submit(transaction)
+
+    def send_transaction(self, sender, to=None, data="0x"):
+        """
+        Sends an unsigned transaction from sender, with the next nonce of sender.
+        :return: the hash of the transaction
+        """
+        with self._lock:
+            nonce = self.pending_nonce(sender.lower())
+            data_bytes = bytes.fromhex(data[2:])
+            transaction = {"from": sender, "nonce": nonce, "gas": intrinsic_gas(data_bytes, to is None),
+                           "gasPrice": 0, "to": to, "value": 0, "input": data,
+                           "hash": "0x" + keccak(rlp.encode([bytes.fromhex(sender[2:]), nonce, data_bytes])).hex()}
+            return self.submit(transaction)
+
+    def submit(self, transaction):
+        """
+        Queues a decoded transaction and mines it right away when block_time is 0.
+        :return: the hash of the transaction
+        :raise ValueError: if the nonce is already used or the gas does not cover the data
+        """
+        sender = transaction["from"].lower()
+        with self._lock:
+            if transaction["hash"] in self.transactions:
+                raise ValueError("already known")
+            if transaction["nonce"] < self.nonces.get(sender, 0):
+                raise ValueError("nonce too low")
+            if transaction["nonce"] in self.queued.get(sender, {}):
+                raise ValueError("replacement transaction underpriced")
+            if transaction["gas"] < intrinsic_gas(bytes.fromhex(transaction["input"][2:]), transaction["to"] is None):
+                raise ValueError("intrinsic gas too low")
+            self.queued.setdefault(sender, {})[transaction["nonce"]] = transaction
+            self.transactions[transaction["hash"]] = transaction
+            if self.block_time <= 0:
+                self.mine()
+        return transaction["hash"]
+
+    def mine(self):
+        """
+        Mines the queued transactions whose nonce follows the last mined nonce of their sender.
+        :return: the number of the new block, None if no transaction could be mined and blocks are mined on demand
+        """
+        with self._lock:
+            included = []
+            for sender, queued in self.queued.items():
+                nonce = self.nonces.get(sender, 0)
+                while nonce in queued:
+                    included.append(queued.pop(nonce))
+                    nonce += 1
+                self.nonces[sender] = nonce
+            if not included and self.block_time <= 0:
+                return None
+            return self._seal_block(included)
+
+    def _seal_block(self, transactions):
+        number = len(self.blocks)
+        parent_hash = self.blocks[-1]["hash"] if self.blocks else ZERO_WORD
+        timestamp = int(time())
+        block_hash = "0x" + keccak(rlp.encode([number, bytes.fromhex(parent_hash[2:]), timestamp] +
+                                              [bytes.fromhex(t["hash"][2:]) for t in transactions])).hex()
+        cumulative_gas = 0
+        for index, transaction in enumerate(transactions):
+            contract_address = None
+            if transaction["to"] is None:
+                contract_address = create_address(transaction["from"], transaction["nonce"])
+                self.code[contract_address.lower()] = transaction["input"]
+            gas_used = intrinsic_gas(bytes.fromhex(transaction["input"][2:]), transaction["to"] is None)
+            cumulative_gas += gas_used
+            transaction.update(blockHash=block_hash, blockNumber=number, transactionIndex=index)
+            self.receipts[transaction["hash"]] = {
+                "transactionHash": transaction["hash"], "transactionIndex": hex(index), "blockHash": block_hash,
+                "blockNumber": hex(number), "from": transaction["from"], "to": transaction["to"],
+                "contractAddress": contract_address, "gasUsed": hex(gas_used),
+                "cumulativeGasUsed": hex(cumulative_gas), "effectiveGasPrice": hex(transaction["gasPrice"]),
+                "status": "0x1", "logs": [], "logsBloom": EMPTY_BLOOM, "type": "0x0"}
+        self.blocks.append({
+            "number": hex(number), "hash": block_hash, "parentHash": parent_hash, "timestamp": hex(timestamp),
+            "nonce": "0x0000000000000000", "sha3Uncles": ZERO_WORD, "logsBloom": EMPTY_BLOOM,
+            "transactionsRoot": ZERO_WORD, "stateRoot": ZERO_WORD, "receiptsRoot": ZERO_WORD, "miner": ZERO_ADDRESS,
+            "difficulty": "0x0", "totalDifficulty": "0x0", "extraData": "0x", "size": "0x0",
+            "gasLimit": hex(BLOCK_GAS_LIMIT), "gasUsed": hex(cumulative_gas), "uncles": [],
+            "transactions": [transaction["hash"] for transaction in transactions]})
+        self.blocks_by_hash[block_hash] = number
+        return number
+
+    def _mine_blocks(self):
+        while not self._stopped.wait(self.block_time):
+            self.mine()
+
+    def format_transaction(self, transaction):
+        formatted = dict(transaction, nonce=hex(transaction["nonce"]), gas=hex(transaction["gas"]),
+                         gasPrice=hex(transaction["gasPrice"]), value=hex(transaction["value"]))
+        formatted.pop("chainId", None)
+        if "blockNumber" in transaction:
+            formatted.update(blockNumber=hex(transaction["blockNumber"]),
+                             transactionIndex=hex(transaction["transactionIndex"]))
+        else:
+            formatted.update(blockHash=None, blockNumber=None, transactionIndex=None)
+        return formatted
+
+    def get_transaction(self, tx_hash):
+        with self._lock:
+            transaction = self.transactions.get(tx_hash.lower())
+            return self.format_transaction(transaction) if transaction is not None else None
+
+    def get_receipt(self, tx_hash):
+        with self._lock:
+            return self.receipts.get(tx_hash.lower())
+
+    def get_code(self, address, block="latest"):
+        with self._lock:
+            return self.code.get(address.lower(), "0x")
+
+    def get_block(self, number, full=False):
+        with self._lock:
+            if number is None or not 0 <= number < len(self.blocks):
+                return None
+            block = self.blocks[number]
+            if full:
+                block = dict(block, transactions=[self.format_transaction(self.transactions[tx_hash])
+                                                  for tx_hash in block["transactions"]])
+            return block
+
+    def close(self):
+        self._stopped.set()
+
+
+class BackendSimulator:
+    """
+    Thread safe in memory backend answering the routes of api_client.ApiClient.
+    """
+
+    def __init__(self, chain=None, latency=0):
+        """
+        :param chain: ChainSimulator receiving the signed transactions, transactions are only recorded if None
+        :param latency: seconds added to every HTTP request
+        """
+        self.chain = chain
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.users = set()
+        self.officers = {}
+        self.notices = {}
+        self.applications = {}
+        self.drcs = {}
+        self.transactions = {}
+        self.routes = {
+            ("POST", "/tdr/addUser"): self.add_user,
+            ("POST", "/user/kda/addOfficer"): self.add_officer,
+            ("POST", "/user/kda/updateOfficer"): self.update_officer,
+            ("GET", "/user/getDashboardData"): self.dashboard_data,
+            ("POST", "/user/transaction/sign"): self.sign_transaction,
+            ("POST", "/user/transaction/status"): self.transaction_status,
+            ("POST", "/tdr/notice/create"): self.create_notice,
+            ("POST", "/tdr/application/create"): self.create_tdr_application,
+            ("POST", "/tdr/application/sign"): self.application_step("tdr", "signed"),
+            ("POST", "/tdr/application/UserSignStatus"): self.user_sign_status,
+            ("POST", "/tdr/application/verify"): self.application_step("tdr", "verified"),
+            ("POST", "/tdr/application/approve"): self.application_step("tdr", "approved"),
+            ("POST", "/tdr/application/issueDrc"): self.issue_drc,
+            ("POST", "/drc/application/transfer/create"): self.create_application("dta", "dta"),
+            ("POST", "/drc/application/transfer/sign"): self.application_step("dta", "signed"),
+            ("POST", "/drc/application/transfer/verify"): self.application_step("dta", "verified"),
+            ("POST", "/drc/application/transfer/approve"): self.application_step("dta", "approved"),
+            ("POST", "/drc/application/utilization/create"): self.create_application("dua", None),
+            ("POST", "/drc/application/utilization/sign"): self.application_step("dua", "signed"),
+            ("POST", "/drc/application/utilization/get"): self.get_application,
+        }
+
+    def respond(self, method, path, headers, body):
+        """
+        Answers an HTTP request to the backend.
+        :return: tuple (http status, json response)
+        """
+        sleep(self.latency)
+        if not headers.get("Authorization", "").lower().startswith("bearer "):
+            return 401, {"message": "missing bearer token"}
+        route = self.routes.get((method, path))
+        if route is None:
+            return 404, {"message": "no route for %s %s" % (method, path)}
+        try:
+            payload = json.loads(body) if body else {}
+            with self._lock:
+                data = route(payload)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return 400, {"message": "invalid request: %s" % e}
+        return 200, {"message": "success", "data": data}
+
+    def new_id(self, prefix):
+        return "%s%08d" % (prefix, next(self._ids))
+
+    def new_transaction(self, description):
+        """
+        :return: the trxId of a new transaction waiting to be signed
+        """
+        trx_id = self.new_id("TRX")
+        self.transactions[trx_id] = {"trxId": trx_id, "description": description, "signed": False}
+        return trx_id
+
+    def find_application(self, application_id, kind):
+        application = self.applications.get(application_id)
+        if application is None or application["kind"] != kind:
+            raise ValueError("unknown %s application %s" % (kind, application_id))
+        return application
+
+    def add_user(self, payload):
+        self.users.add("KDAUSER00042")
+        return {"userId": "KDAUSER00042"}
+
+    def add_officer(self, officer):
+        self.officers[officer["userId"]] = officer
+        return officer
+
+    def update_officer(self, officer):
+        if officer["userId"] not in self.officers:
+            raise ValueError("unknown officer %s" % officer["userId"])
+        self.officers[officer["userId"]].update(officer)
+        return self.officers[officer["userId"]]
+
+    def dashboard_data(self, payload):
+        counts = {"notices": len(self.notices), "drcs": len(self.drcs),
+                  "transactions": len(self.transactions),
+                  "signedTransactions": sum(1 for trx in self.transactions.values() if trx["signed"])}
+        for application in self.applications.values():
+            counts[application["kind"] + "Applications"] = counts.get(application["kind"] + "Applications", 0) + 1
+        return counts
+
+    def sign_transaction(self, sign):
+        trx_id = sign["trxId"]
+        transaction = self.transactions.get(trx_id)
+        if transaction is None:
+            raise ValueError("unknown transaction %s" % trx_id)
+        if not sign.get("otp") or not sign.get("password"):
+            raise ValueError("otp and password are required")
+        if transaction["signed"]:
+            raise ValueError("transaction %s already signed" % trx_id)
+        transaction["signed"] = True
+        if self.chain is not None:
+            transaction["transactionHash"] = self.chain.send_transaction(
+                BACKEND_ACCOUNT, BACKEND_CONTRACT, "0x" + trx_id.encode().hex())
+        return dict(transaction)
+
+    def transaction_status(self, payload):
+        """
+        Reports a transaction "unsigned" until it is signed, then "pending" until its receipt is on the simulated chain
+        and "mined" or "failed" after. Without a chain a signed transaction is reported mined.
+        """
+        transaction = self.transactions.get(payload["trxId"])
+        if transaction is None:
+            raise ValueError("unknown transaction %s" % payload["trxId"])
+        status = "unsigned" if not transaction["signed"] else "mined"
+        if transaction.get("transactionHash") is not None:
+            receipt = self.chain.get_receipt(transaction["transactionHash"])
+            if receipt is None:
+                status = "pending"
+            elif receipt["status"] != "0x1":
+                status = "failed"
+        return dict(transaction, status=status)
+
+    def create_notice(self, notice):
+        notice_id = self.new_id("NOTICE")
+        self.notices[notice_id] = dict(notice, noticeId=notice_id)
+        return {"noticeId": notice_id, "trxId": self.new_transaction("create notice " + notice_id)}
+
+    def create_tdr_application(self, payload):
+        application = payload["tdrApplication"]
+        if application.get("noticeId") not in self.notices:
+            raise ValueError("unknown notice %s" % application.get("noticeId"))
+        return self.create_application("tdr", "tdrApplication")(payload)
+
+    def create_application(self, kind, key):
+        """
+        Returns the route creating an application of kind from the payload, or from payload[key] if key is set.
+        """
+
+        def create(payload):
+            application_id = self.new_id(kind.upper())
+            application = payload[key] if key else payload
+            self.applications[application_id] = dict(application, applicationId=application_id, kind=kind,
+                                                      status="pending")
+            return {"applicationId": application_id,
+                    "trxId": self.new_transaction("create %s application %s" % (kind, application_id))}
+
+        return create
+
+    def application_step(self, kind, status):
+        """
+        Returns the route moving an application of kind to status.
+        """
+
+        def step(payload):
+            application = self.find_application(payload["applicationId"], kind)
+            application["status"] = status
+            return {"applicationId": application["applicationId"],
+                    "trxId": self.new_transaction("%s application %s %s" % (kind, application["applicationId"],
+                                                                           status))}
+
+        return step
+
+    def user_sign_status(self, payload):
+        application = self.find_application(payload["applicationId"], "tdr")
+        return {"applicationId": application["applicationId"], "status": application["status"],
+                "signed": application["status"] != "pending"}
+
+    def issue_drc(self, payload):
+        application = self.find_application(payload["applicationId"], "tdr")
+        drc_id = self.new_id("DRC")
+        self.drcs[drc_id] = {"drcId": drc_id, "applicationId": application["applicationId"],
+                             "farCredited": payload["farGranted"]}
+        application["status"] = "drc issued"
+        return {"drcId": drc_id, "trxId": self.new_transaction("issue drc " + drc_id)}
+
+    def get_application(self, payload):
+        return dict(self.find_application(payload["applicationId"], "dua"))
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive HTTP handler passing every request to the respond method of server.simulator.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def handle_request(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status, response = self.server.simulator.respond(self.command, self.path, self.headers, body)
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(simulator, host="127.0.0.1", port=0):
+    """
+    Serves a ChainSimulator or a BackendSimulator from a background thread.
+    :param port: port to listen on, a free port is picked if 0
+    :return: the server, whose port is server.server_address[1] and which is stopped with server.shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), SimulatorHandler)
+    server.daemon_threads = True
+    server.simulator = simulator
+    threading.Thread(target=server.serve_forever, name="simulator-%d" % server.server_address[1],
+                     daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local chain and backend to benchmark the deployer and the "
+                                                 "tests offline")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--chain-port", type=int, default=8545, help="port of the JSON-RPC chain, 0 to disable it")
+    parser.add_argument("--backend-port", type=int, default=8000, help="port of the backend, 0 to disable it")
+    parser.add_argument("--chain-id", type=int, default=SIMULATOR_CHAIN_ID, help="chain id of the chain")
+    parser.add_argument("--block-time", type=float, default=0,
+                        help="seconds between two blocks, transactions are mined as soon as they are received if 0")
+    parser.add_argument("--chain-latency", type=float, default=0, help="seconds added to every JSON-RPC request")
+    parser.add_argument("--backend-latency", type=float, default=0, help="seconds added to every backend request")
+    args = parser.parse_args()
+    servers = []
+    chain = None
+    if args.chain_port:
+        chain = ChainSimulator(args.chain_id, args.block_time, args.chain_latency)
+        servers.append(start_server(chain, args.host, args.chain_port))
+        print("chain simulator listening on http://%s:%d" % (args.host, args.chain_port))
+    if args.backend_port:
+        servers.append(start_server(BackendSimulator(chain, args.backend_latency), args.host, args.backend_port))
+        print("backend simulator listening on http://%s:%d" % (args.host, args.backend_port))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    for server in servers:
+        server.shutdown()
+    if chain is not None:
+        chain.close()
+
+
+if __name__ == "__main__":
+    main()
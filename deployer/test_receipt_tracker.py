@@ -0,0 +1,59 @@
+"""
+Tests of receipt_tracker.py, run from this directory with:
+    python3 -m unittest test_receipt_tracker
+"""
+
+import unittest
+from types import SimpleNamespace
+
+from hexbytes import HexBytes
+
+from receipt_tracker import ReceiptTracker, hex_hash
+
+TX_HASH = "0x" + "ab" * 32
+OTHER_TX_HASH = "0x" + "cd" * 32
+
+
+class FakeProvider:
+    """
+    Answers the receipt batches of the tracker from a dictionary of raw receipts.
+    """
+
+    def __init__(self, receipts):
+        self.receipts = receipts
+
+    def make_batch_request(self, calls):
+        return [self.receipts.get(params[0]) for method, params in calls]
+
+
+def raw_receipt(tx_hash):
+    return {"transactionHash": tx_hash, "blockNumber": "0x1", "gasUsed": "0x5208", "status": "0x1",
+            "contractAddress": None}
+
+
+class ReceiptTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        w3 = SimpleNamespace(provider=FakeProvider({TX_HASH: raw_receipt(TX_HASH),
+                                                    OTHER_TX_HASH: raw_receipt(OTHER_TX_HASH)}))
+        self.tracker = ReceiptTracker(w3, poll_latency=0.01)
+
+    def test_hex_hash(self):
+        self.assertEqual(hex_hash(TX_HASH), TX_HASH)
+        self.assertEqual(hex_hash(TX_HASH.upper().replace("0X", "0x")), TX_HASH)
+        self.assertEqual(hex_hash(bytes.fromhex(TX_HASH[2:])), TX_HASH)
+        self.assertEqual(hex_hash(HexBytes(TX_HASH)), TX_HASH)
+
+    def test_wait_with_str_and_bytes(self):
+        self.assertEqual(self.tracker.wait(TX_HASH, timeout=5)["status"], 1)
+        self.assertEqual(self.tracker.wait(HexBytes(OTHER_TX_HASH), timeout=5)["status"], 1)
+
+    def test_wait_all_with_str_and_bytes(self):
+        receipts = self.tracker.wait_all([HexBytes(TX_HASH), OTHER_TX_HASH], timeout=5)
+        self.assertEqual(set(receipts), {TX_HASH, OTHER_TX_HASH})
+        self.assertEqual(receipts[TX_HASH]["transactionHash"], TX_HASH)
+        self.assertEqual(receipts[OTHER_TX_HASH]["blockNumber"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
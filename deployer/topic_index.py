@@ -0,0 +1,64 @@
+"""
+Event topic and function selector index of a deployment.
+
+Maps the topic0 of every event and the 4-byte selector of every function of the compiled contracts to the contract
+declaring it, its ABI entry and the address at which the contract is deployed (from addresses.txt), so a consumer
+can match and decode a log with a single dictionary lookup instead of hashing every event signature. The index is
+written to ../build/index/topic_index.json and published with the ABIs:
+
+    {
+      "logs": {"<address>:<topic0>": entry},          # address in lower case, what a log carries
+      "topics": {"<topic0>": [entry, ...]},           # every contract declaring the event, deployed or not
+      "selectors": {"<selector>": [entry, ...]},
+      "addresses": {"<address>": contract}
+    }
+
+where entry is {"contract": ..., "address": ... or null, "signature": ..., "abi": {ABI entry}}.
+"""
+
+from eth_utils import keccak
+
+from packed_artifacts import abi_signature
+
+INDEX_FILE = "../build/index/topic_index.json"
+
+
+def build_index(compiled_contracts, contract_addresses):
+    """
+    :param compiled_contracts: dictionary with the contract name as key and its abi and bin as value
+    :param contract_addresses: dictionary with the contract name as key and its deployed address as value
+    :return: the index, as described in the module docstring
+    """
+    index = {"logs": {}, "topics": {}, "selectors": {}, "addresses": {}}
+    for contract in sorted(compiled_contracts):
+        address = contract_addresses.get(contract)
+        if address is not None:
+            index["addresses"][address.lower()] = contract
+        for abi_entry in compiled_contracts[contract].get('abi', []):
+            if abi_entry.get("type") not in ("function", "event"):
+                continue
+            signature = abi_signature(abi_entry)
+            digest = keccak(text=signature)
+            entry = {"contract": contract, "address": address, "signature": signature, "abi": abi_entry}
+            if abi_entry["type"] == "function":
+                index["selectors"].setdefault("0x" + digest[:4].hex(), []).append(entry)
+                continue
+            topic = "0x" + digest.hex()
+            index["topics"].setdefault(topic, []).append(entry)
+            # anonymous events have no topic0 to match
+            if address is not None and not abi_entry.get("anonymous"):
+                index["logs"][address.lower() + ":" + topic] = entry
+    return index
+
+
+def match_log(index, log):
+    """
+    Returns the index entry of the event which emitted a log, or None.
+    :param log: log as returned by eth_getLogs, with hex address and topics
+    """
+    if not log.get("topics"):
+        return None
+    topic = log["topics"][0]
+    if not isinstance(topic, str):
+        topic = "0x" + bytes(topic).hex()
+    return index["logs"].get(log["address"].lower() + ":" + topic.lower())
@@ -0,0 +1,181 @@
+"""
+Confirmation aware signing of the backend transactions.
+
+Endpoints such as /tdr/notice/create return the trxId of a transaction which the backend only sends once it is
+signed with /user/transaction/sign. Instead of sleeping a fixed second before signing and moving on without knowing
+whether anything was mined, TransactionTracker:
+    1. signs right away and, while the backend answers with a 429 or a 503 (the transaction is not ready yet),
+       retries with an exponential backoff until a deadline. Any other error fails at once: after a 502 or a 504
+       the backend may already have signed and sent the transaction, and signing the trxId again would send it twice
+    2. if the data of the sign response holds the transactionHash of the transaction sent to the chain, polls the
+       node for its receipt, again with backoff, and fails if the transaction reverted
+    3. otherwise polls /user/transaction/status for the trxId until the backend reports it mined or failed
+
+The status route is served by simulator.py but not by every backend. When it answers 404, or when no status call is
+given, the successful sign call is taken as the confirmation, as before, and a warning is logged.
+"""
+
+import http.client
+import json
+import logging
+from time import monotonic, sleep
+from urllib.parse import urlparse
+
+# key of the data of a sign or status response holding the hash of the transaction sent to the chain
+TX_HASH_KEY = "transactionHash"
+# status of a transaction in a /user/transaction/status response
+CONFIRMED_STATUSES = ("mined", "confirmed", "success")
+FAILED_STATUSES = ("failed", "reverted")
+# http status of a sign call worth retrying, the backend did not send the transaction
+SIGN_RETRY_STATUSES = (429, 503)
+
+logger = logging.getLogger()
+
+
+class TransactionFailed(Exception):
+    pass
+
+
+def backoff(initial=0.05, factor=2, maximum=1.0):
+    """
+    Yields the delays between two attempts: initial, initial * factor, ... up to maximum.
+    """
+    delay = initial
+    while True:
+        yield delay
+        delay = min(maximum, delay * factor)
+
+
+def is_retryable(status):
+    """
+    Whether a status call answered with this http status may succeed later. It only reads, so any server error is
+    retried.
+    """
+    return status is None or status >= 500 or status == 429
+
+
+def response_data(body):
+    """
+    Returns the data of a decoded backend response, {} if it has none.
+    """
+    if isinstance(body, dict) and isinstance(body.get("data"), dict):
+        return body["data"]
+    return {}
+
+
+def transaction_hash(body):
+    """
+    Returns the transactionHash of the data of a sign or status response, or None.
+    """
+    value = response_data(body).get(TX_HASH_KEY)
+    if isinstance(value, str) and value.startswith("0x") and len(value) == 66:
+        return value
+    return None
+
+
+class TransactionTracker:
+
+    def __init__(self, node_url=None, sign_timeout=30, confirm_timeout=120):
+        """
+        :param node_url: http url of the node used to wait for the receipts, receipts are not waited for if None
+        :param sign_timeout: seconds during which a sign call failing with a retryable status is retried
+        :param confirm_timeout: seconds to wait for a signed transaction to be mined
+        """
+        self.node = urlparse(node_url) if node_url else None
+        self.sign_timeout = sign_timeout
+        self.confirm_timeout = confirm_timeout
+        # False once the backend answered 404 to a status call
+        self.status_supported = True
+
+    def sign(self, send_sign):
+        """
+        Signs a transaction, retrying with backoff while the backend answers with one of SIGN_RETRY_STATUSES.
+        :param send_sign: function sending the sign call and returning (http status, decoded json body)
+        :return: the decoded json body of the successful sign call
+        :raise TransactionFailed: if the sign call fails with another status, or still fails after sign_timeout
+        """
+        deadline = monotonic() + self.sign_timeout
+        for delay in backoff():
+            status, body = send_sign()
+            if status == 200:
+                return body
+            if status not in SIGN_RETRY_STATUSES or monotonic() + delay > deadline:
+                raise TransactionFailed("sign call failed with status %s: %s" % (status, body))
+            sleep(delay)
+
+    def wait_for_receipt(self, tx_hash):
+        """
+        Polls the node until the transaction is mined.
+        :return: the receipt, or None if no node is configured
+        :raise TransactionFailed: if the transaction reverted or is not mined after confirm_timeout
+        """
+        if self.node is None:
+            return None
+        deadline = monotonic() + self.confirm_timeout
+        conn = http.client.HTTPConnection(self.node.hostname, self.node.port)
+        try:
+            for delay in backoff(maximum=2.0):
+                conn.request("POST", self.node.path or "/", json.dumps({
+                    "jsonrpc": "2.0", "id": 1, "method": "eth_getTransactionReceipt", "params": [tx_hash]}),
+                    {'Content-Type': 'application/json'})
+                receipt = json.loads(conn.getresponse().read()).get("result")
+                if receipt is not None:
+                    if int(receipt["status"], 16) != 1:
+                        raise TransactionFailed("transaction %s reverted" % tx_hash)
+                    return receipt
+                if monotonic() + delay > deadline:
+                    raise TransactionFailed("transaction %s not mined after %s seconds" %
+                                            (tx_hash, self.confirm_timeout))
+                sleep(delay)
+        finally:
+            conn.close()
+
+    def wait_for_status(self, send_status):
+        """
+        Polls the backend until it reports the transaction mined.
+        :param send_status: function sending the status call of the transaction and returning
+                            (http status, decoded json body)
+        :return: the data of the status response, None if the backend has no status route
+        :raise TransactionFailed: if the status call is rejected, the transaction failed or it is not mined after
+                                  confirm_timeout
+        """
+        deadline = monotonic() + self.confirm_timeout
+        for delay in backoff(maximum=2.0):
+            status, body = send_status()
+            if status == 404:
+                self.status_supported = False
+                return None
+            if status == 200:
+                data = response_data(body)
+                if data.get("status") in CONFIRMED_STATUSES:
+                    return data
+                if data.get("status") in FAILED_STATUSES:
+                    raise TransactionFailed("transaction %s failed: %s" % (data.get("trxId"), data))
+            elif not is_retryable(status):
+                raise TransactionFailed("status call failed with status %s: %s" % (status, body))
+            if monotonic() + delay > deadline:
+                raise TransactionFailed("transaction not mined after %s seconds, last status %s: %s" %
+                                        (self.confirm_timeout, status, body))
+            sleep(delay)
+
+    def confirm(self, body, send_status=None):
+        """
+        Waits for the transaction of a successful sign call to be mined: from its receipt when the sign response holds
+        its hash and a node is configured, otherwise from the status reported by the backend. If the backend has no
+        status route, the sign call is taken as the confirmation and a warning is logged.
+        :param body: decoded json body of the sign call
+        :param send_status: function sending the status call of the transaction and returning
+                            (http status, decoded json body), such as partial(api.transaction_status, trx_id)
+        :return: the receipt, the data of the status response, or None if the transaction could not be confirmed
+        :raise TransactionFailed: if the transaction failed
+        """
+        tx_hash = transaction_hash(body)
+        if tx_hash is not None and self.node is not None:
+            return self.wait_for_receipt(tx_hash)
+        if send_status is not None and self.status_supported:
+            data = self.wait_for_status(send_status)
+            if data is not None:
+                return data
+        logger.warning("transaction %s not confirmed: the sign response holds no transaction hash and no status call "
+                       "is available, taking the sign call as the confirmation", response_data(body).get("trxId"))
+        return None